@@ -0,0 +1,230 @@
+# admission.py
+import logging
+import math
+import threading
+import time
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED, BROWNOUT_ACTIVE
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+MODES = ("auto", "on", "off")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; retry_after is a suggested wait in seconds"""
+
+    def __init__(self, route_class, reason, retry_after):
+        super().__init__(f"{route_class} requests are over capacity ({reason})")
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _RouteClass:
+    def __init__(self, name, limit, max_queue, queue_timeout):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.waiting = 0
+        self.latency_ewma = None
+        self.admitted = 0
+        self.rejected = 0
+        self.cond = threading.Condition()
+
+
+class _Ticket:
+    __slots__ = ("route_class", "start", "brownout")
+
+    def __init__(self, route_class, brownout):
+        self.route_class = route_class
+        self.start = time.monotonic()
+        self.brownout = brownout
+
+
+class AdmissionController:
+    """
+    Bounded concurrency and queueing per route class, with a brownout mode.
+
+    Each class runs at most `limit` requests at once; up to `max_queue`
+    more wait for a slot, for at most `queue_timeout` seconds. Anything
+    beyond that is rejected straight away, so a slow model backs requests
+    up here rather than in the server's accept queue.
+
+    Brownout covers the class that calls the model. It starts when that
+    class's queue fills past `brownout_queue_ratio` of its bound or its
+    full-service latency (EWMA) exceeds `brownout_latency`. It holds for
+    at least `brownout_hold` seconds after the last trigger. While it
+    lasts, requests are admitted as degraded and the routes answer from
+    cache or local scoring. The latency average restarts on entry, so
+    the first full requests afterwards probe whether the model recovered.
+    """
+
+    def __init__(self, classes, brownout_class="model", brownout_queue_ratio=0.5,
+                 brownout_latency=10.0, brownout_hold=30.0, mode="auto"):
+        self.classes = {
+            name: _RouteClass(name, limit, max_queue, queue_timeout)
+            for name, (limit, max_queue, queue_timeout) in classes.items()
+        }
+        self.brownout_class = brownout_class
+        self.brownout_queue_ratio = brownout_queue_ratio
+        self.brownout_latency = brownout_latency
+        self.brownout_hold = brownout_hold
+        self.mode = None
+        self._brownout_until = 0.0
+        self._brownout_since = None
+        self._lock = threading.Lock()
+        self.set_mode(mode)
+
+    @classmethod
+    def from_env(cls, env):
+        """
+        Build a controller from ADMISSION_* and BROWNOUT_* settings
+
+        Route classes are "model" (routes that call the model) and "cheap"
+        (local lookups), each with _CONCURRENCY, _QUEUE and _QUEUE_TIMEOUT.
+        """
+        classes = {
+            "model": (int(env.get("ADMISSION_MODEL_CONCURRENCY", "8")),
+                      int(env.get("ADMISSION_MODEL_QUEUE", "16")),
+                      float(env.get("ADMISSION_MODEL_QUEUE_TIMEOUT", "10"))),
+            "cheap": (int(env.get("ADMISSION_CHEAP_CONCURRENCY", "32")),
+                      int(env.get("ADMISSION_CHEAP_QUEUE", "64")),
+                      float(env.get("ADMISSION_CHEAP_QUEUE_TIMEOUT", "5")))
+        }
+        return cls(
+            classes,
+            brownout_queue_ratio=float(env.get("BROWNOUT_QUEUE_RATIO", "0.5")),
+            brownout_latency=float(env.get("BROWNOUT_LATENCY_SECONDS", "10")),
+            brownout_hold=float(env.get("BROWNOUT_HOLD_SECONDS", "30")),
+            mode=env.get("BROWNOUT_MODE", "auto")
+        )
+
+    def set_mode(self, mode):
+        """Let brownout follow load ("auto") or force it "on" or "off" """
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.mode = mode
+        self._update_gauge()
+
+    @property
+    def brownout(self):
+        """Whether model-backed requests should currently be served degraded"""
+        if self.mode != "auto":
+            return self.mode == "on"
+        now = time.monotonic()
+        with self._lock:
+            if self._brownout_since is not None and now >= self._brownout_until:
+                logger.warning(f"Brownout ended after {now - self._brownout_since:.1f}s")
+                self._brownout_since = None
+            # Also refreshes the gauge in workers forked after it was last set
+            self._update_gauge()
+            return self._brownout_since is not None
+
+    def _update_gauge(self):
+        BROWNOUT_ACTIVE.set(1 if self.mode == "on" or (self.mode == "auto" and self._brownout_since) else 0)
+
+    def _check_brownout(self, route_class):
+        # Called with the class condition held
+        if route_class.name != self.brownout_class or self.mode != "auto":
+            return
+        queue_full = route_class.max_queue and route_class.waiting >= route_class.max_queue * self.brownout_queue_ratio
+        slow = route_class.latency_ewma is not None and route_class.latency_ewma >= self.brownout_latency
+        if not (queue_full or slow):
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            self._brownout_until = now + self.brownout_hold
+            if self._brownout_since is None:
+                self._brownout_since = now
+                logger.warning(f"Brownout started: {route_class.waiting} queued, "
+                               f"latency {route_class.latency_ewma or 0:.2f}s")
+                self._update_gauge()
+        route_class.latency_ewma = None
+
+    def _retry_after(self, route_class):
+        # Time for the queue ahead to drain at the current service rate, at least a second
+        latency = route_class.latency_ewma or 1.0
+        return max(1, math.ceil((route_class.waiting + 1) / max(route_class.limit, 1) * latency))
+
+    def admit(self, name):
+        """
+        Wait for a slot in a route class
+
+        Returns:
+            A ticket to pass to release(), or None for unknown classes
+
+        Raises:
+            AdmissionRejected: When the queue is full or the wait times out
+        """
+        route_class = self.classes.get(name)
+        if route_class is None:
+            return None
+
+        with route_class.cond:
+            if route_class.active >= route_class.limit:
+                if route_class.waiting >= route_class.max_queue:
+                    self._reject(route_class, "queue_full")
+
+                route_class.waiting += 1
+                ADMISSION_QUEUE_DEPTH.inc(route_class=name)
+                self._check_brownout(route_class)
+                try:
+                    deadline = time.monotonic() + route_class.queue_timeout
+                    while route_class.active >= route_class.limit:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(route_class, "queue_timeout")
+                        route_class.cond.wait(remaining)
+                finally:
+                    route_class.waiting -= 1
+                    ADMISSION_QUEUE_DEPTH.dec(route_class=name)
+
+            route_class.active += 1
+            route_class.admitted += 1
+
+        return _Ticket(route_class, name == self.brownout_class and self.brownout)
+
+    def _reject(self, route_class, reason):
+        route_class.rejected += 1
+        ADMISSION_REJECTED.inc(route_class=route_class.name, reason=reason)
+        raise AdmissionRejected(route_class.name, reason, self._retry_after(route_class))
+
+    def release(self, ticket):
+        """Free the ticket's slot, recording its latency if it was served in full"""
+        if ticket is None:
+            return
+        route_class = ticket.route_class
+        with route_class.cond:
+            route_class.active -= 1
+            if not ticket.brownout:
+                latency = time.monotonic() - ticket.start
+                route_class.latency_ewma = latency if route_class.latency_ewma is None \
+                    else 0.8 * route_class.latency_ewma + 0.2 * latency
+                self._check_brownout(route_class)
+            route_class.cond.notify()
+
+    def stats(self):
+        """Return per-class load and the brownout state for monitoring"""
+        return {
+            "mode": self.mode,
+            "brownout": self.brownout,
+            "classes": [
+                {
+                    "route_class": rc.name,
+                    "limit": rc.limit,
+                    "active": rc.active,
+                    "waiting": rc.waiting,
+                    "max_queue": rc.max_queue,
+                    "latency_ewma": round(rc.latency_ewma, 4) if rc.latency_ewma is not None else None,
+                    "admitted": rc.admitted,
+                    "rejected": rc.rejected
+                }
+                for rc in self.classes.values()
+            ]
+        }
@@ -1,15 +1,35 @@
 # app.py
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, Response, g, render_template, request, jsonify, redirect, url_for, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.utils import secure_filename
 import os
 import io
+import hashlib
+import hmac
+import json
 import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from dotenv import load_dotenv
 import google.generativeai as genai
+from PIL import Image
 
 # Import custom modules
 from ai_analysis_service import SustainabilityAnalyzer
 from recommendation_engine import EcoRecommendationEngine
+from image_similarity import ImageHashCache
+from job_queue import JobQueue
+from catalog_feed import iter_records
+from catalog_db import SqlCatalogBackend, db, engine_options
+from admission import AdmissionController, AdmissionRejected
+from rate_limit import ClientRateLimiter
+import metrics
+import profiling
+import tracing
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -18,26 +38,130 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# Configure Google API
+# Configure Google API (not needed with MODEL_BACKEND=fake, which answers offline)
 api_key = os.getenv("GOOGLE_API_KEY")
-if not api_key:
+if not api_key and os.getenv("MODEL_BACKEND", "gemini") != "fake":
     logger.error("GOOGLE_API_KEY not found in environment variables")
     raise ValueError("GOOGLE_API_KEY is required. Please set it in the .env file.")
-genai.configure(api_key=api_key)
+if api_key:
+    genai.configure(api_key=api_key)
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "supersecretkey")
 
+# Behind a reverse proxy, take the client address from X-Forwarded-For (set to the number of proxies)
+TRUST_PROXY_HOPS = int(os.environ.get("TRUST_PROXY_HOPS", "0"))
+if TRUST_PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUST_PROXY_HOPS)
+
 # Configure upload folder for images
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # Max upload size: 16MB
 
+# Configure the catalog database (SQLite by default, e.g. postgresql://... for Postgres)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL", "sqlite:///greencart.db")
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+db.init_app(app)
+
 # Initialize analyzer and recommendation engine
 analyzer = SustainabilityAnalyzer()
-recommendation_engine = EcoRecommendationEngine()
+# "sql" (default) shares one catalog database between workers and picks up their edits;
+# "memory" keeps a per-worker catalog loaded from CATALOG_SNAPSHOT or CATALOG_FEED, which
+# boots fastest (the snapshot is memory-mapped) but never sees another worker's writes
+CATALOG_STORAGE = os.environ.get("CATALOG_STORAGE", "sql")
+# Skip live store searches for alternatives (e.g. under load tests with the fake model backend)
+RECOMMENDATION_OFFLINE = os.environ.get("RECOMMENDATION_OFFLINE", "false").lower() in ('1', 'true', 'yes', 'on')
+# Perceptual hashes of catalog images are shared between workers, so each image is downloaded once
+image_hash_cache = ImageHashCache(os.environ.get("IMAGE_HASH_DB_PATH", "image_hashes.db"))
+if CATALOG_STORAGE == "sql":
+    # The database is the shared catalog; each worker keeps a read-through cache of it
+    recommendation_engine = EcoRecommendationEngine(
+        storage=SqlCatalogBackend(app),
+        refresh_interval=float(os.environ.get("CATALOG_REFRESH_SECONDS", "5")),
+        image_hash_cache=image_hash_cache,
+        offline=RECOMMENDATION_OFFLINE
+    )
+else:
+    recommendation_engine = EcoRecommendationEngine(image_hash_cache=image_hash_cache, offline=RECOMMENDATION_OFFLINE)
+
+# Shared pool for bulk analyses; its size is the global cap on concurrent model calls
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", "100"))
+bulk_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("BULK_MAX_CONCURRENCY", "8")),
+    thread_name_prefix="bulk-analysis"
+)
+
+# Shared pool for the independent stages of a single request (formatting, alternatives, ...)
+stage_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("STAGE_MAX_CONCURRENCY", "16")),
+    thread_name_prefix="request-stage"
+)
+
+# Combined analyses: one deadline for all parts, and a small cache of complete results
+ANALYZE_FULL_DEADLINE = float(os.environ.get("ANALYZE_FULL_DEADLINE", "20"))
+ANALYZE_FULL_CACHE_SIZE = int(os.environ.get("ANALYZE_FULL_CACHE_SIZE", "1000"))
+ANALYZE_FULL_CACHE_TTL = float(os.environ.get("ANALYZE_FULL_CACHE_TTL", "3600"))
+full_analysis_cache = OrderedDict()
+full_analysis_cache_lock = threading.Lock()
+
+# Admission control: bounded concurrency and queueing per route class. Routes that call
+# the model switch to cached or locally scored results while the controller is in brownout
+admission = AdmissionController.from_env(os.environ)
+ROUTE_CLASSES = {
+    "analyze_product": "model",
+    "analyze_products_bulk": "model",
+    "analyze_full": "model",
+    "upload_image": "model",
+    "find_alternatives": "cheap",
+    "submit_job": "cheap",
+    "get_job": "cheap",
+    "get_categories": "cheap",
+    "get_category_products": "cheap",
+    "get_material_alternatives": "cheap"
+}
+# Job tasks that call the model when they run; /jobs requests for them are admitted and
+# charged to client quotas as model routes
+MODEL_JOB_TASKS = {"analyze", "greenwashing", "image"}
+
+def route_class_for_request():
+    """Route class of the current request, classifying /jobs submissions by their task"""
+    route_class = ROUTE_CLASSES.get(request.endpoint)
+    if request.endpoint == "submit_job":
+        data = request.get_json(silent=True) if request.is_json else request.form
+        if isinstance(data, dict) and data.get("task") in MODEL_JOB_TASKS:
+            return "model"
+    return route_class
+
+# Per-client quotas on the same route classes, so one client cannot use up everyone's capacity.
+# Clients are identified by a known API key (X-Api-Key), otherwise by IP address
+client_limiter = ClientRateLimiter.from_env(os.environ)
+CLIENT_API_KEYS = {k.strip() for k in os.environ.get("CLIENT_API_KEYS", "").split(",") if k.strip()}
+
+# Background jobs for long-running analyses, persisted in SQLite. Model-backed tasks
+# check brownout when they run, like the synchronous routes do when they are admitted
+JOB_TASKS = {
+    "analyze": lambda payload, image: analyzer.analyze_product_description(
+        payload["description"], use_model=not admission.brownout
+    ),
+    "greenwashing": lambda payload, image: analyzer.identify_greenwashing(
+        payload["description"], use_model=not admission.brownout
+    ),
+    "alternatives": lambda payload, image: recommendation_engine.find_alternatives(
+        payload["description"], payload.get("category", "")
+    ),
+    "image": lambda payload, image: analyzer.analyze_product_image(
+        image, detect_multiple=payload.get("detect_multiple", False), use_model=not admission.brownout
+    )
+}
+job_queue = JobQueue(
+    os.environ.get("JOB_DB_PATH", "jobs.db"),
+    JOB_TASKS,
+    workers=int(os.environ.get("JOB_WORKERS", "4")),
+    lease_seconds=int(os.environ.get("JOB_LEASE_SECONDS", "600"))
+)
 
 # Preload some sample products
 def preload_sample_products():
@@ -84,11 +208,206 @@ def preload_sample_products():
         }
     ]
     
-    for product in sample_products:
-        recommendation_engine.add_product_to_database(product)
+    recommendation_engine.bulk_load_products(sample_products)
     
     logger.info(f"Preloaded {len(sample_products)} sample products")
 
+def load_catalog():
+    if recommendation_engine.storage:
+        load_catalog_from_storage()
+        return
+    
+    # Map a saved snapshot if there is one; it loads in milliseconds and is shared between workers
+    snapshot_path = os.environ.get("CATALOG_SNAPSHOT")
+    if snapshot_path and os.path.exists(snapshot_path):
+        try:
+            recommendation_engine.load_snapshot(snapshot_path)
+            return
+        except Exception as e:
+            logger.error(f"Error loading catalog snapshot {snapshot_path}: {str(e)}")
+    
+    # Stream a catalog feed if one is configured, otherwise fall back to the samples
+    feed_path = os.environ.get("CATALOG_FEED")
+    if not feed_path:
+        preload_sample_products()
+    else:
+        try:
+            stats = recommendation_engine.bulk_load_products(iter_records(feed_path))
+            logger.info(f"Catalog loaded from {feed_path}: {stats}")
+        except Exception as e:
+            logger.error(f"Error loading catalog feed {feed_path}: {str(e)}")
+            preload_sample_products()
+    
+    # Save a snapshot so the next start can skip the feed
+    if snapshot_path:
+        try:
+            recommendation_engine.save_snapshot(snapshot_path)
+        except Exception as e:
+            logger.error(f"Error saving catalog snapshot {snapshot_path}: {str(e)}")
+
+def load_catalog_from_storage():
+    try:
+        # Seed an empty database once; upserts make concurrent seeding by several workers harmless
+        if recommendation_engine.storage.count() == 0:
+            feed_path = os.environ.get("CATALOG_FEED")
+            if feed_path:
+                stats = recommendation_engine.bulk_load_products(iter_records(feed_path))
+                logger.info(f"Catalog database seeded from {feed_path}: {stats}")
+            else:
+                preload_sample_products()
+        
+        # Warm the in-process cache with everything in the database
+        recommendation_engine.refresh_from_storage(force=True)
+    except Exception as e:
+        logger.error(f"Error loading catalog from database: {str(e)}")
+
+# Load the catalog at import so every gunicorn worker (or the preloading master) starts with it
+load_catalog()
+
+# Hash catalog product images in the background so uploads can be matched without the vision model;
+# each worker starts its indexer on its first request and picks up new products every interval
+IMAGE_INDEX = os.environ.get("IMAGE_INDEX", "true").lower() in ('1', 'true', 'yes', 'on')
+IMAGE_INDEX_INTERVAL = float(os.environ.get("IMAGE_INDEX_INTERVAL", "30"))
+
+def form_flag(name, default=False):
+    """Read a boolean form field such as detect_multiple=true"""
+    value = request.form.get(name)
+    if value is None:
+        return default
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+@app.before_request
+def start_request_metrics():
+    # Start the metrics writer, job workers and image indexer in this process (no-ops after the
+    # first request per worker; threads started in a preloading master would not survive the fork)
+    metrics.registry.start()
+    job_queue.start()
+    if IMAGE_INDEX:
+        recommendation_engine.start_image_indexing(IMAGE_INDEX_INTERVAL)
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+    g.trace = tracing.Trace(f"{request.method} {g.metrics_route}")
+
+@app.after_request
+def record_request_metrics(response):
+    if "metrics_start" in g:
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - g.metrics_start,
+                                     route=g.metrics_route, method=request.method)
+        metrics.HTTP_REQUESTS.inc(route=g.metrics_route, method=request.method, status=response.status_code)
+    if "trace" in g:
+        trace = g.trace
+        trace.root.attrs["status"] = response.status_code
+        if response.is_streamed:
+            # The work of a streamed response (bulk results, job events) runs while the body is
+            # sent, after this hook, so the trace is finished once the stream closes. Headers are
+            # gone by then, so streamed responses carry no Server-Timing
+            response.call_on_close(lambda: finish_trace(trace))
+        else:
+            response.headers["Server-Timing"] = finish_trace(trace)
+    return response
+
+def finish_trace(trace):
+    """Close a request's trace, export it if sampled and return its Server-Timing value"""
+    trace.finish()
+    if trace.sampled:
+        tracing.exporter.export(trace)
+    return trace.server_timing()
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if "metrics_route" in g:
+        metrics.HTTP_IN_FLIGHT.dec(route=g.metrics_route)
+
+def client_identity():
+    """Identify the caller for quotas; unknown API keys count as their IP so they can't mint fresh buckets"""
+    api_key = request.headers.get("X-Api-Key", "")
+    if api_key in CLIENT_API_KEYS:
+        return f"key:{api_key}"
+    return f"ip:{request.remote_addr}"
+
+@app.before_request
+def limit_client():
+    route_class = route_class_for_request()
+    if route_class is None:
+        return None
+    # A bulk request uses model capacity for every description in it
+    cost = 1
+    if request.endpoint == "analyze_products_bulk":
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            data = data.get("descriptions")
+        cost = len(data) if isinstance(data, list) and data else 1
+
+    wait, remaining = client_limiter.check(route_class, client_identity(), cost)
+    if wait > 0:
+        retry_after = max(1, math.ceil(wait))
+        metrics.CLIENT_RATE_LIMITED.inc(route_class=route_class)
+        logger.warning(f"Client quota exceeded for {route_class} routes: {request.method} {request.path}")
+        response = jsonify({"error": "Too many requests, please slow down", "retry_after": retry_after})
+        response.headers["Retry-After"] = str(retry_after)
+        return response, 429
+    if remaining is not None:
+        # A bulk request larger than the burst leaves the bucket in debt
+        g.quota_remaining = max(0, int(remaining))
+
+@app.before_request
+def admit_request():
+    route_class = route_class_for_request()
+    if route_class is None:
+        return None
+    try:
+        with tracing.stage("admission", route_class=route_class):
+            g.admission_ticket = admission.admit(route_class)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected {request.method} {request.path}: {e}")
+        response = jsonify({"error": "Server is busy, please retry later", "retry_after": e.retry_after})
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response, 429
+    # Model-backed routes read this to answer without calling the model
+    g.brownout = g.admission_ticket.brownout
+    if g.brownout:
+        metrics.BROWNOUT_RESPONSES.inc(route=g.metrics_route)
+
+@app.after_request
+def mark_brownout(response):
+    if g.get("brownout"):
+        response.headers["X-Brownout"] = "1"
+    if "quota_remaining" in g:
+        response.headers["X-RateLimit-Remaining"] = str(g.quota_remaining)
+    return response
+
+@app.teardown_request
+def release_admission(exc):
+    if "admission_ticket" in g:
+        admission.release(g.pop("admission_ticket"))
+
+@app.before_request
+def start_request_profile():
+    # Admin calls (including the one waiting on the session) are not profiled
+    if not request.path.startswith('/admin/'):
+        g.profile_token = profiling.profiler.request_started()
+
+@app.teardown_request
+def finish_request_profile(exc):
+    if "profile_token" in g:
+        profiling.profiler.request_finished(g.pop("profile_token"))
+
+def admin_authorized():
+    """Check the request carries ADMIN_TOKEN; admin endpoints are disabled when it is unset"""
+    admin_token = os.environ.get("ADMIN_TOKEN")
+    if not admin_token:
+        return False
+    supplied = request.headers.get("X-Admin-Token", "")
+    authorization = request.headers.get("Authorization", "")
+    if authorization.startswith("Bearer "):
+        supplied = authorization[len("Bearer "):]
+    return hmac.compare_digest(supplied.encode("utf-8"), admin_token.encode("utf-8"))
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different inputs share a cache key"""
+    return re.sub(r'\s+', ' ', text or '').strip()
+
 # Routes
 @app.route('/')
 def index():
@@ -106,7 +425,7 @@ def analyze_product():
         logger.debug(f"Analyzing product: {description[:50]}...")
         
         # Analyze the product
-        analysis = analyzer.analyze_product_description(description)
+        analysis = analyzer.analyze_product_description(description, use_model=not g.get("brownout"))
         
         # Return the analysis
         return jsonify({"analysis": analysis})
@@ -117,6 +436,140 @@ def analyze_product():
 
 
 
+@app.route('/analyze/bulk', methods=['POST'])
+def analyze_products_bulk():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('descriptions')
+    
+    if not isinstance(data, list) or not data:
+        return jsonify({"error": "Expected a JSON array of product descriptions"}), 400
+    if len(data) > BULK_MAX_ITEMS:
+        return jsonify({"error": f"At most {BULK_MAX_ITEMS} descriptions per request"}), 400
+    if not all(isinstance(d, str) and d.strip() for d in data):
+        return jsonify({"error": "Every description must be a non-empty string"}), 400
+    
+    # Collapse repeated descriptions so each is analyzed once
+    unique = {}
+    for index, description in enumerate(data):
+        key = normalize_text(description).lower()
+        unique.setdefault(key, (description, []))[1].append(index)
+    
+    logger.debug(f"Bulk analysis of {len(data)} descriptions ({len(unique)} unique)")
+    
+    def result_lines(indices, analysis, cached):
+        return ''.join(
+            json.dumps({"index": index, "analysis": analysis, "cached": cached}) + '\n'
+            for index in indices
+        )
+    
+    use_model = not g.get("brownout")
+    
+    def generate():
+        futures = {}
+        try:
+            # Queue every miss on the shared pool before writing anything, so a slow
+            # reader of the stream cannot hold back the model work
+            hits = []
+            for description, indices in unique.values():
+                cached = analyzer.lookup_cached_analysis(description)
+                if cached:
+                    hits.append((indices, cached))
+                else:
+                    # Already looked up above, so the analysis goes straight to the model
+                    analyze = tracing.in_context(analyzer.analyze_product_description)
+                    futures[bulk_executor.submit(analyze, description, use_model, skip_cache=True)] = indices
+
+            for indices, cached in hits:
+                yield result_lines(indices, cached, True)
+
+            # Stream the remaining results in completion order
+            for future in as_completed(futures):
+                try:
+                    analysis = future.result()
+                except Exception as e:
+                    logger.error(f"Error in bulk analysis item: {str(e)}")
+                    analysis = {"error": f"Error analyzing product: {str(e)}"}
+                yield result_lines(futures[future], analysis, False)
+        finally:
+            # Client went away: don't spend model capacity on unread results
+            for future in futures:
+                future.cancel()
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/analyze_full', methods=['POST'])
+def analyze_full():
+    try:
+        data = request.get_json(silent=True) or request.form
+        description = normalize_text(data.get('description'))
+        category = normalize_text(data.get('category')).lower()
+        materials = normalize_text(data.get('materials'))
+        
+        if not description:
+            return jsonify({"error": "Product description is required"}), 400
+        
+        cache_key = hashlib.sha1(f"{description.lower()}|{category}|{materials.lower()}".encode("utf-8")).hexdigest()
+        with full_analysis_cache_lock:
+            cached = full_analysis_cache.get(cache_key)
+            hit = cached is not None and time.time() - cached[0] < ANALYZE_FULL_CACHE_TTL
+            metrics.record_cache("analyze_full", hit)
+            if hit:
+                full_analysis_cache.move_to_end(cache_key)
+                return jsonify(dict(cached[1], cached=True))
+        
+        logger.debug(f"Full analysis of: {description[:50]}...")
+        
+        # Every part works from the same normalized input and shares one deadline
+        use_model = not g.get("brownout")
+        parts = {
+            "analysis": (analyzer.analyze_product_description, description, use_model),
+            "greenwashing": (analyzer.identify_greenwashing, description, use_model),
+            "alternatives": (recommendation_engine.find_alternatives, description, category)
+        }
+        if materials:
+            parts["material_alternatives"] = (recommendation_engine.suggest_ingredient_alternatives, materials)
+        futures = {
+            stage_executor.submit(tracing.in_context(func), *args): part
+            for part, (func, *args) in parts.items()
+        }
+        
+        done, not_done = wait(futures, timeout=ANALYZE_FULL_DEADLINE)
+        
+        response = {"cache_key": cache_key, "timed_out": [], "errors": {}}
+        for future in done:
+            part = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Error in full analysis part {part}: {str(e)}")
+                response["errors"][part] = str(e)
+                continue
+            response[part] = result
+            # The analyzer reports model failures as {"error": ...} rather than raising
+            if isinstance(result, dict) and "error" in result:
+                logger.error(f"Full analysis part {part} failed: {result['error']}")
+                response["errors"][part] = str(result["error"])
+        for future in not_done:
+            # Drop parts that have not started; running ones finish in the background
+            future.cancel()
+            response["timed_out"].append(futures[future])
+        response["timed_out"].sort()
+        
+        # Only complete, full-quality results are worth serving again
+        if use_model and not response["timed_out"] and not response["errors"]:
+            with full_analysis_cache_lock:
+                full_analysis_cache[cache_key] = (time.time(), response)
+                full_analysis_cache.move_to_end(cache_key)
+                while len(full_analysis_cache) > ANALYZE_FULL_CACHE_SIZE:
+                    full_analysis_cache.popitem(last=False)
+        
+        return jsonify(dict(response, cached=False))
+    
+    except Exception as e:
+        logger.error(f"Error in full analysis: {str(e)}")
+        return jsonify({"error": f"Error analyzing product: {str(e)}"}), 500
+
 @app.route('/alternatives', methods=['POST'])
 def find_alternatives():
     try:
@@ -157,48 +610,84 @@ def upload_image():
             # Save the uploaded file
             filename = secure_filename(file.filename)
             file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
+            with tracing.stage("save_upload"):
+                file.save(file_path)
+                
+                logger.debug(f"Image uploaded to: {file_path}")
+                
+                # Analyze the image
+                with open(file_path, "rb") as img_file:
+                    image_data = img_file.read()
             
-            logger.debug(f"Image uploaded to: {file_path}")
+            # Each stage beyond the analysis itself is opt-in
+            detect_multiple = form_flag('detect_multiple')
+            include_formatted = form_flag('include_formatted')
+            include_alternatives = form_flag('include_alternatives')
             
-            # Analyze the image
-            with open(file_path, "rb") as img_file:
-                image_data = img_file.read()
+            # A photo of a known catalog product reuses its stored analysis instead of the vision model
+            image_match = None
+            if not detect_multiple:
+                try:
+                    with tracing.stage("image_match"):
+                        image_match = recommendation_engine.match_product_image(Image.open(io.BytesIO(image_data)))
+                except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+                    # Pillow raises these for truncated, corrupt or unsupported image data
+                    logger.error(f"Unreadable image upload {filename}: {str(e)}")
+                    return jsonify({"error": "The uploaded file is not a readable image"}), 400
             
-            # Use the analyzer to process the image
-            logger.debug(f"Starting image analysis for {filename}")
-            analysis = analyzer.analyze_product_image(image_data)
-            logger.debug(f"Analysis completed: {str(analysis)[:500]}...")
+            alternatives_future = None
+            if image_match:
+                product = image_match["product"]
+                # The product is already known, so alternatives need not wait for the analysis
+                if include_alternatives:
+                    alternatives_future = stage_executor.submit(
+                        tracing.in_context(recommendation_engine.find_alternatives),
+                        product.get("description", product.get("name", "")), product.get("category")
+                    )
+                analysis = analyzer.analyze_matched_product(product, image_match["match"],
+                                                            use_model=not g.get("brownout"))
+            else:
+                logger.debug(f"Starting image analysis for {filename} (detect_multiple={detect_multiple})")
+                analysis = analyzer.analyze_product_image(image_data, detect_multiple=detect_multiple,
+                                                          use_model=not g.get("brownout"))
+                logger.debug(f"Analysis completed: {str(analysis)[:500]}...")
             
             if not analysis or "error" in analysis:
                 logger.error(f"Analysis returned error or empty result: {analysis.get('error') if analysis else 'None'}")
+                if alternatives_future:
+                    alternatives_future.cancel()
                 return jsonify({
                     "error": "Unable to analyze image",
                     "details": analysis.get("error") if analysis else "No analysis returned",
                     "analysis": analysis
                 })
             
-            # Format the analysis for display
-            formatted_analysis = analyzer.format_analysis_for_display(analysis)
-            logger.debug(f"Formatted analysis generated, length: {len(formatted_analysis)}")
+            # Formatting and the alternatives lookup are independent, so run them side by side
+            formatted_future = None
+            if include_formatted:
+                formatted_future = stage_executor.submit(
+                    tracing.in_context(analyzer.format_analysis_for_display), analysis
+                )
             
-            # Find eco-friendly alternatives based on detected product
-            product_name = ""
-            product_description = ""
-            if "image_analysis" in analysis and "product_name" in analysis["image_analysis"]:
-                product_name = analysis["image_analysis"]["product_name"]
-                product_description = analysis["image_analysis"].get("description", "")
+            if include_alternatives and alternatives_future is None:
+                # Find eco-friendly alternatives based on the detected (first) product
+                primary = analysis["products"][0] if analysis.get("multiple_products") and analysis.get("products") else analysis
+                product_name = primary.get("image_analysis", {}).get("product_name", "")
+                product_description = primary.get("image_analysis", {}).get("description", "")
+                if product_name:
+                    logger.debug(f"Looking for alternatives for: {product_name}")
+                    alternatives_future = stage_executor.submit(
+                        tracing.in_context(recommendation_engine.find_alternatives),
+                        f"{product_name}. {product_description}"
+                    )
             
-            logger.debug(f"Looking for alternatives for: {product_name}")
-            alternatives = []
-            if product_name:
-                alternatives = recommendation_engine.find_alternatives(
-                    f"{product_name}. {product_description}"
-                )
-                logger.debug(f"Found {len(alternatives)} alternatives")
-            return jsonify({
-                "analysis": analysis,
-            })
+            response = {"analysis": analysis}
+            if formatted_future:
+                response["formatted_analysis"] = formatted_future.result()
+            if include_alternatives:
+                response["alternatives"] = alternatives_future.result() if alternatives_future else []
+                logger.debug(f"Found {len(response['alternatives'])} alternatives")
+            return jsonify(response)
     
     except Exception as e:
         logger.error(f"Error processing image: {str(e)}")
@@ -209,6 +698,65 @@ def upload_image():
             "details": str(e)
         }), 500
 
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        # Accept JSON for text tasks, or a multipart form carrying an image
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+            image_data = None
+        else:
+            data = request.form.to_dict()
+            image_file = request.files.get('image')
+            image_data = image_file.read() if image_file and image_file.filename else None
+        
+        task = data.pop('task', '')
+        if task not in JOB_TASKS:
+            return jsonify({"error": f"Unknown task. Expected one of: {', '.join(JOB_TASKS)}"}), 400
+        
+        if task == 'image':
+            if not image_data:
+                return jsonify({"error": "No image file provided"}), 400
+            data['detect_multiple'] = str(data.get('detect_multiple', 'false')).lower() in ('1', 'true', 'yes', 'on')
+        elif not data.get('description'):
+            return jsonify({"error": "Product description is required"}), 400
+        
+        job_id = job_queue.submit(task, data, image=image_data)
+        logger.debug(f"Queued {task} job {job_id}")
+        
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": url_for('get_job', job_id=job_id),
+            "events_url": url_for('get_job_events', job_id=job_id)
+        }), 202
+    
+    except Exception as e:
+        logger.error(f"Error submitting job: {str(e)}")
+        return jsonify({"error": f"Error submitting job: {str(e)}"}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found"}), 404
+        
+        return jsonify(job)
+    
+    except Exception as e:
+        logger.error(f"Error fetching job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    # Stream status changes as Server-Sent Events until the job finishes
+    return Response(
+        stream_with_context(job_queue.events(job_id)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.route('/categories', methods=['GET'])
 def get_categories():
     try:
@@ -262,14 +810,116 @@ def get_material_alternatives():
         logger.error(f"Error finding material alternatives: {str(e)}")
         return jsonify({"alternatives": {}, "error": str(e)}), 500
 
+@app.route('/routing_stats', methods=['GET'])
+def get_routing_stats():
+    try:
+        # Per-route latency and token metrics for tuning the model routing policy,
+        # plus per-key concurrency limits from the model backend
+        return jsonify({
+            "routes": analyzer.router.stats(),
+            "keys": analyzer.backend.stats()
+        })
+    
+    except Exception as e:
+        logger.error(f"Error fetching routing stats: {str(e)}")
+        return jsonify({"routes": [], "error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format, summed across workers when METRICS_DIR is set
+    return Response(metrics.registry.exposition(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/usage', methods=['GET'])
+def get_usage():
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        # Token usage and estimated cost per day, endpoint, method and model,
+        # plus this worker's before/after prompt sizes per template
+        days = min(max(int(request.args.get('days', '7')), 1), 90)
+        usage = analyzer.usage.stats(days)
+        usage["prompts"] = analyzer.prompts.stats()
+        return jsonify(usage)
+    
+    except Exception as e:
+        logger.error(f"Error fetching usage stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/admission', methods=['GET', 'POST'])
+def admission_status():
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        # POST mode=auto|on|off overrides brownout in this worker until the next change
+        if request.method == 'POST':
+            admission.set_mode(request.values.get('mode', 'auto'))
+        return jsonify(dict(admission.stats(), pid=os.getpid()))
+    
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error updating admission control: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def profile_worker():
+    """
+    Profile this worker over its next requests.
+
+    POST starts a session (mode=cprofile|sample|tracemalloc, requests=N,
+    seconds=T) and by default waits for it to finish; with wait=false it
+    returns at once and GET fetches the result later. Sessions are per
+    worker process, so use a threaded worker (or a single one) and check
+    the returned pid.
+    """
+    if not admin_authorized():
+        return jsonify({"error": "Forbidden"}), 403
+    try:
+        output_format = request.values.get('format', 'text')
+        if request.method == 'GET':
+            session = profiling.profiler.session
+            if session is None:
+                return jsonify({"error": "No profiling session in this worker", "pid": os.getpid()}), 404
+        else:
+            session = profiling.ProfileSession(
+                mode=request.values.get('mode', 'cprofile'),
+                requests=min(max(int(request.values.get('requests', '20')), 1), 10000),
+                seconds=min(max(float(request.values.get('seconds', '30')), 0.1), 600),
+                interval=min(max(float(request.values.get('interval_ms', '5')), 1), 1000) / 1000,
+                include_idle=request.values.get('include_idle', 'false').lower() in ('1', 'true', 'yes', 'on'),
+                app_only=request.values.get('app_only', 'true').lower() in ('1', 'true', 'yes', 'on'),
+                top=min(max(int(request.values.get('top', '50')), 1), 1000)
+            )
+            profiling.profiler.start(session)
+            if request.values.get('wait', 'true').lower() in ('1', 'true', 'yes', 'on'):
+                session.done.wait(session.seconds + 5)
+
+        if not session.done.is_set():
+            return jsonify(dict(session.summary(), status="running")), 202
+
+        body, mimetype = profiling.profiler.result(session, output_format)
+        if mimetype == 'application/json':
+            return jsonify(body)
+        response = Response(body, mimetype=mimetype)
+        response.headers['X-Profile-Pid'] = str(os.getpid())
+        response.headers['X-Profile-Requests'] = str(session.requests_seen)
+        if output_format == 'raw':
+            response.headers['Content-Disposition'] = f'attachment; filename=profile-{os.getpid()}.pstats'
+        return response
+
+    except profiling.ProfilerBusyError as e:
+        return jsonify({"error": str(e), "pid": os.getpid()}), 409
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error profiling worker: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/test_image_upload')
 def test_image_upload():
     """A simple page for testing image uploads"""
     return render_template('test_image_upload.html')
 
 if __name__ == '__main__':
-    # Preload sample products
-    preload_sample_products()
-    
     # Run the Flask app
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
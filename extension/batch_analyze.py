@@ -0,0 +1,226 @@
+# batch_analyze.py
+"""
+Score a catalog export offline.
+
+Streams a CSV or JSONL feed through SustainabilityAnalyzer (and optionally
+EcoRecommendationEngine), writing one JSON line per input row in input
+order. Progress is checkpointed, so rerunning the same command after a
+crash resumes where it stopped.
+
+A row whose analysis failed (a model error, or a keyword estimate in
+place of a model answer) is retried with exponential backoff. If it still
+fails the run stops before that row is checkpointed, so a quota outage
+does not fill the output with failures; rerun to resume from it, or pass
+--skip-failures to write such rows with an "error" and carry on.
+
+    python batch_analyze.py catalog.csv results.jsonl --concurrency 8 --rate 5
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from catalog_feed import iter_records
+from rate_limit import TokenBucket
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+
+def load_checkpoint(path):
+    """Return the saved progress, or a fresh start if there is none"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"rows_done": 0, "output_bytes": 0}
+
+
+def save_checkpoint(path, rows_done, output_bytes):
+    """Atomically record how many rows (and output bytes) are safely written"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"rows_done": rows_done, "output_bytes": output_bytes, "updated_at": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class RowFailed(Exception):
+    """Raised when a row's analysis still fails after all retries"""
+
+    def __init__(self, row, reason):
+        super().__init__(f"row {row}: {reason}")
+        self.row = row
+        self.reason = reason
+
+
+def failure_reason(result):
+    """Why a row's analyses cannot be kept as a success, or None if they can"""
+    for part in ("analysis", "greenwashing"):
+        value = result.get(part)
+        if not isinstance(value, dict):
+            continue
+        # The analyzer reports failures in the result instead of raising
+        if "error" in value:
+            return f"{part}: {value['error']}"
+        if value.get("degraded") or value.get("estimated"):
+            return f"{part}: no model answer, only a keyword estimate"
+    return None
+
+
+def analyze_record(record, row, args, analyzer, engine, bucket):
+    """Run the configured analyses for one input record, retrying failed attempts"""
+    description = (record.get(args.description_field) or "").strip()
+    result = {"row": row}
+    if args.id_field and args.id_field in record:
+        result["id"] = record[args.id_field]
+
+    if not description:
+        result["error"] = f"Missing {args.description_field}"
+        return result
+
+    for attempt in range(args.retries + 1):
+        if attempt:
+            delay = args.retry_backoff * 2 ** (attempt - 1)
+            logger.warning(f"Row {row} failed ({reason}), retry {attempt} of {args.retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+        attempt_result = dict(result)
+        try:
+            bucket.acquire()
+            attempt_result["analysis"] = analyzer.analyze_product_description(description)
+
+            if args.greenwashing:
+                bucket.acquire()
+                attempt_result["greenwashing"] = analyzer.identify_greenwashing(description)
+
+            if args.alternatives:
+                attempt_result["alternatives"] = engine.find_alternatives(
+                    description, record.get(args.category_field, "")
+                )
+            reason = failure_reason(attempt_result)
+        except Exception as e:
+            logger.error(f"Error analyzing row {row}: {e}")
+            reason = str(e)
+
+        if reason is None:
+            return attempt_result
+
+    if not args.skip_failures:
+        raise RowFailed(row, reason)
+    attempt_result["error"] = reason
+    return attempt_result
+
+
+def run(args):
+    # Imported here so --help works without model credentials
+    from ai_analysis_service import SustainabilityAnalyzer
+    from recommendation_engine import EcoRecommendationEngine
+
+    analyzer = SustainabilityAnalyzer()
+    engine = EcoRecommendationEngine() if args.alternatives else None
+    bucket = TokenBucket(args.rate, capacity=args.concurrency)
+
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint"
+    checkpoint = load_checkpoint(checkpoint_path)
+    if not os.path.exists(args.output):
+        checkpoint = {"rows_done": 0, "output_bytes": 0}
+    rows_done = checkpoint["rows_done"]
+
+    # Drop anything written after the last checkpoint so rows are never duplicated
+    output = open(args.output, "r+b" if checkpoint["output_bytes"] else "wb")
+    output.truncate(checkpoint["output_bytes"])
+    output.seek(checkpoint["output_bytes"])
+
+    if rows_done:
+        logger.info(f"Resuming after {rows_done} rows")
+
+    records = itertools.islice(iter_records(args.input, args.format), rows_done, None)
+    window = args.concurrency * 2
+    pending = deque()
+    start_time = time.time()
+    last_checkpoint = start_time
+    processed = 0
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for row, record in enumerate(itertools.chain(records, [None]), start=rows_done):
+            if record is not None:
+                pending.append(executor.submit(analyze_record, record, row, args, analyzer, engine, bucket))
+                if len(pending) < window:
+                    continue
+
+            # Write completed rows in input order; the window bounds memory use
+            while pending and (record is None or len(pending) >= window):
+                try:
+                    result = pending.popleft().result()
+                except RowFailed as e:
+                    # Keep everything before the failed row; it and later rows are redone on resume
+                    for future in pending:
+                        future.cancel()
+                    output.flush()
+                    os.fsync(output.fileno())
+                    save_checkpoint(checkpoint_path, rows_done, output.tell())
+                    output.close()
+                    logger.error(f"Stopping at {e}. {rows_done} rows are done; rerun the same command to resume")
+                    return 1
+                output.write((json.dumps(result) + "\n").encode("utf-8"))
+                rows_done += 1
+                processed += 1
+
+                now = time.time()
+                if processed % args.checkpoint_every == 0 or now - last_checkpoint > 30:
+                    output.flush()
+                    os.fsync(output.fileno())
+                    save_checkpoint(checkpoint_path, rows_done, output.tell())
+                    last_checkpoint = now
+                    logger.info(f"{rows_done} rows done ({processed / (now - start_time):.1f} rows/sec)")
+
+    output.flush()
+    os.fsync(output.fileno())
+    save_checkpoint(checkpoint_path, rows_done, output.tell())
+    output.close()
+
+    elapsed = time.time() - start_time
+    logger.info(f"Finished: {processed} rows in {elapsed:.1f}s "
+                f"({processed / elapsed if elapsed else 0:.1f} rows/sec), {rows_done} total")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV/JSONL product feed for sustainability")
+    parser.add_argument("input", help="CSV or JSONL file of products")
+    parser.add_argument("output", help="JSONL file to write results to")
+    parser.add_argument("--format", choices=["auto", "csv", "jsonl"], default="auto")
+    parser.add_argument("--description-field", default="description")
+    parser.add_argument("--category-field", default="category")
+    parser.add_argument("--id-field", default="id")
+    parser.add_argument("--greenwashing", action="store_true", help="Also run greenwashing detection")
+    parser.add_argument("--alternatives", action="store_true", help="Also look up eco-friendly alternatives")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent model calls")
+    parser.add_argument("--rate", type=float, default=5.0, help="Maximum model calls per second")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="Rows between checkpoints")
+    parser.add_argument("--retries", type=int, default=3, help="Retries for a row whose analysis failed")
+    parser.add_argument("--retry-backoff", type=float, default=5.0,
+                        help="Seconds before the first retry, doubling for each further one")
+    parser.add_argument("--skip-failures", action="store_true",
+                        help="Write rows that still fail with an error instead of stopping the run")
+    args = parser.parse_args(argv)
+
+    return run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+# bench.py
+"""
+Microbenchmarks for the recommendation and analysis hot paths.
+
+Runs offline: the analyzer uses the fake model backend and the
+recommendation engine skips live store searches. Run from the extension
+directory:
+
+    python benchmarks/bench.py                          # print results
+    python benchmarks/bench.py --save baseline.json     # store a baseline
+    python benchmarks/bench.py --compare baseline.json  # exit 1 on regressions
+
+A benchmark regresses when its median time per call is more than
+--threshold (default 10%) slower than the baseline. Compare baselines
+taken on the same machine.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+EXTENSION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXTENSION_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# No model credentials, no network and no stray files in the working directory
+os.environ.setdefault("MODEL_BACKEND", "fake")
+os.environ.setdefault("USAGE_DB_PATH", os.path.join(tempfile.mkdtemp(), "usage.db"))
+
+import corpora  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+
+def _benchmarks():
+    """
+    Build the benchmark table
+
+    Returns:
+        dict: name -> (function, list of argument tuples)
+    """
+    from PIL import Image
+
+    from ai_analysis_service import SustainabilityAnalyzer
+    from image_encoding import encode_for_vision
+    from recommendation_engine import EcoRecommendationEngine
+
+    analyzer = SustainabilityAnalyzer()
+    engine = EcoRecommendationEngine(offline=True)
+
+    def preprocess_image(image_data):
+        # The same steps analyze_product_image takes before calling the model
+        image = Image.open(io.BytesIO(image_data))
+        image.thumbnail((1024, 1024), Image.LANCZOS)
+        return encode_for_vision(image, byte_budget=analyzer.vision_byte_budget,
+                                 min_quality=analyzer.vision_min_quality)
+
+    def extract_json(text):
+        try:
+            return analyzer._extract_json(text)
+        except Exception:
+            return None
+
+    products = corpora.products()
+    return {
+        "extract_product_type": (engine._extract_product_type, [(text,) for text in corpora.descriptions()]),
+        "get_specific_product": (engine._get_specific_product, products),
+        "get_eco_friendly_products": (
+            engine._get_eco_friendly_products,
+            [(product_type, engine._get_specific_product(product_type, text)) for product_type, text in products]
+        ),
+        "generate_eco_alternatives_from_category": (
+            engine.generate_eco_alternatives_from_category, [(category,) for category in corpora.categories()]
+        ),
+        "suggest_ingredient_alternatives": (
+            engine.suggest_ingredient_alternatives, [(materials,) for materials in corpora.material_lists()]
+        ),
+        "extract_json": (extract_json, [(text,) for text in corpora.model_replies()]),
+        "parse_score": (analyzer._parse_score, [(score,) for score in corpora.scores()]),
+        "format_analysis_for_display": (
+            analyzer.format_analysis_for_display, [(analysis,) for analysis in corpora.analyses()]
+        ),
+        "image_preprocess": (preprocess_image, [(data,) for data in corpora.images()])
+    }
+
+
+def measure(func, inputs, rounds=7, min_time=0.2):
+    """
+    Time func over the whole corpus, repeated for several rounds
+
+    Each round loops over the corpus enough times to run for at least
+    min_time, so fast functions are not dominated by timer resolution.
+
+    Returns:
+        dict: Per-call median, mean, min and max over rounds (microseconds) and calls/sec
+    """
+    # Warm up caches and lazy imports, and size the inner loop
+    start = time.perf_counter()
+    for args in inputs:
+        func(*args)
+    loops = max(1, int(min_time / max(time.perf_counter() - start, 1e-9)))
+
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(loops):
+            for args in inputs:
+                func(*args)
+        per_call.append((time.perf_counter() - start) / (loops * len(inputs)) * 1e6)
+
+    median = statistics.median(per_call)
+    return {
+        "median_us": round(median, 3),
+        "mean_us": round(statistics.mean(per_call), 3),
+        "min_us": round(min(per_call), 3),
+        "max_us": round(max(per_call), 3),
+        "calls_per_sec": round(1e6 / median, 1) if median else None,
+        "corpus_size": len(inputs),
+        "rounds": rounds
+    }
+
+
+def run(selected=None, rounds=7, min_time=0.2):
+    results = {}
+    for name, (func, inputs) in _benchmarks().items():
+        if selected and name not in selected:
+            continue
+        results[name] = measure(func, inputs, rounds, min_time)
+        print(f"{name:42s} {results[name]['median_us']:>12.2f} us/call", file=sys.stderr)
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": results
+    }
+
+
+def compare(current, baseline, threshold=0.10):
+    """
+    Compare median times against a baseline
+
+    Returns:
+        tuple: (rows, regressions) where each row is (name, baseline_us, current_us, change, status)
+    """
+    rows = []
+    regressions = []
+    for name, result in current["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if base is None:
+            rows.append((name, None, result["median_us"], None, "new"))
+            continue
+        change = result["median_us"] / base["median_us"] - 1 if base["median_us"] else 0.0
+        if change > threshold:
+            status = "REGRESSION"
+            regressions.append(name)
+        elif change < -threshold:
+            status = "faster"
+        else:
+            status = "ok"
+        rows.append((name, base["median_us"], result["median_us"], change, status))
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark recommendation and analysis hot paths")
+    parser.add_argument("names", nargs="*", help="Benchmarks to run (default: all)")
+    parser.add_argument("--rounds", type=int, default=7, help="Timed rounds per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds per round")
+    parser.add_argument("--save", help="Write results to this JSON baseline file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative slowdown of the median that counts as a regression")
+    args = parser.parse_args(argv)
+
+    # The code under test logs at DEBUG; keep the timings readable
+    logging.disable(logging.CRITICAL)
+    results = run(set(args.names), args.rounds, args.min_time)
+    logging.disable(logging.NOTSET)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save}", file=sys.stderr)
+
+    if not args.compare:
+        if not args.save:
+            print(json.dumps(results, indent=2))
+        return 0
+
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    rows, regressions = compare(results, baseline, args.threshold)
+    print(f"{'benchmark':42s} {'baseline us':>12s} {'current us':>12s} {'change':>8s}  status")
+    for name, base, current, change, status in rows:
+        base_text = f"{base:12.2f}" if base is not None else f"{'-':>12s}"
+        change_text = f"{change:+8.1%}" if change is not None else f"{'-':>8s}"
+        print(f"{name:42s} {base_text} {current:12.2f} {change_text}  {status}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+# corpora.py
+"""
+Synthetic, seeded inputs for the benchmarks.
+
+Sizes and shapes follow what the app sees: listing descriptions of a few
+words to a scraped page, model replies with and without code fences or
+surrounding prose, and product photos from thumbnails to phone cameras.
+"""
+import io
+import json
+import random
+
+from PIL import Image, ImageDraw, ImageFilter
+
+PRODUCTS = [
+    "hoodie", "t-shirt", "jeans", "running shoes", "rain jacket", "beanie", "smartphone", "laptop",
+    "wireless earbuds", "tablet", "phone charger", "bluetooth speaker", "coffee mug", "dining chair",
+    "bed sheets", "table lamp", "shampoo", "face cream", "lipstick", "bar soap", "board game", "bicycle",
+    "wooden doll", "camping tent", "garden planter", "patio umbrella", "protein snack", "water bottle"
+]
+MATERIALS = [
+    "organic cotton", "recycled polyester", "bamboo", "aluminium", "glass", "stainless steel", "BPA-free plastic",
+    "FSC-certified wood", "hemp", "recycled cardboard", "silicone", "vegan leather", "wool", "cork"
+]
+CLAIMS = [
+    "eco-friendly", "100% natural", "green", "carbon neutral shipping", "plastic-free packaging",
+    "GOTS certified", "Fair Trade certified", "biodegradable", "compostable", "sustainably sourced"
+]
+FILLER = [
+    "Add to cart", "Free shipping on orders over $50", "30-day returns", "4.6 out of 5 stars", "1,283 ratings",
+    "Customers who bought this also bought", "Subscribe to our newsletter", "In stock", "Qty: 1",
+    "Designed for everyday use and built to last.", "Available in five colours.", "Machine washable at 30C."
+]
+UNKNOWN_PRODUCTS = ["gift card", "subscription box", "mystery bundle", "voucher", "sample pack"]
+
+
+def descriptions(count=500, seed=1):
+    """Product descriptions: short titles, typical listings and long scraped pages"""
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        product = rng.choice(PRODUCTS if i % 10 else UNKNOWN_PRODUCTS)
+        kind = i % 3
+        if kind == 0:
+            text = f"{rng.choice(MATERIALS).title()} {product}"
+        else:
+            sentences = [
+                f"This {product} is made from {rng.choice(MATERIALS)} and {rng.choice(MATERIALS)}.",
+                f"It is {rng.choice(CLAIMS)} and {rng.choice(CLAIMS)}."
+            ]
+            sentences += rng.sample(FILLER, 3 if kind == 1 else 10)
+            if kind == 2:
+                sentences *= 4
+            rng.shuffle(sentences)
+            text = " ".join(sentences)
+        result.append(text)
+    return result
+
+
+def products(count=500, seed=2):
+    """(product_type, description) pairs as find_alternatives passes them on"""
+    rng = random.Random(seed)
+    types = ["clothing", "electronics", "home", "beauty", "toys", "outdoor", "food", "general"]
+    return [(rng.choice(types), text) for text in descriptions(count, seed)]
+
+
+def categories(count=200, seed=3):
+    rng = random.Random(seed)
+    names = ["clothing", "electronics", "home", "beauty", "toys", "outdoor", "food", "general", "Kitchen", "Garden"]
+    return [rng.choice(names) for _ in range(count)]
+
+
+def material_lists(count=300, seed=4):
+    """Comma-separated material strings, as the /alternatives form submits them"""
+    rng = random.Random(seed)
+    extra = ["plastic", "polyester", "nylon", "palm oil", "PVC", "leather", "paper", "cotton", "microbeads"]
+    return [", ".join(rng.sample(MATERIALS + extra, rng.randint(1, 6))) for _ in range(count)]
+
+
+def _description_analysis(rng):
+    return {
+        "materials_sustainability": round(rng.uniform(1, 10), 1),
+        "manufacturing_process": round(rng.uniform(1, 10), 1),
+        "carbon_footprint": round(rng.uniform(1, 10), 1),
+        "recyclability": round(rng.uniform(1, 10), 1),
+        "overall_sustainability_score": round(rng.uniform(1, 10), 1),
+        "improvement_opportunities": rng.sample(["Use recycled materials", "Reduce packaging",
+                                                 "Publish supplier audits", "Offer repairs"], 3),
+        "sustainability_tags": {tag: rng.random() < 0.5 for tag in ["Eco-Friendly", "Organic", "Recyclable",
+                                                                     "Biodegradable", "Plastic Packaging"]},
+        "sustainability_justification": " ".join(rng.sample(FILLER, 4)),
+        "greenwashing_risk": rng.choice(["Low", "Medium", "High"])
+    }
+
+
+def _image_analysis(rng):
+    return {
+        "image_analysis": {
+            "product_name": rng.choice(PRODUCTS),
+            "description": " ".join(rng.sample(FILLER, 3)),
+            "visible_materials": rng.sample(MATERIALS, 2),
+            "visible_claims": rng.sample(CLAIMS, 2)
+        },
+        "sustainability_analysis": {
+            "materials_sustainability": rng.uniform(1, 10),
+            "packaging_sustainability": rng.uniform(1, 10),
+            "greenwashing_risk": rng.choice(["Low", "Medium", "High"]),
+            "improvement_suggestions": ["Use recycled materials", "Reduce packaging"],
+            "overall_sustainability_score": rng.uniform(1, 10),
+            "sustainability_justification": " ".join(rng.sample(FILLER, 3))
+        }
+    }
+
+
+def analyses(count=200, seed=5):
+    """Analysis dicts of every shape format_analysis_for_display renders"""
+    rng = random.Random(seed)
+    result = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            result.append(_description_analysis(rng))
+        elif kind == 1:
+            result.append(_image_analysis(rng))
+        else:
+            items = [_image_analysis(rng) for _ in range(rng.randint(2, 4))]
+            result.append({"multiple_products": True, "product_count": len(items), "products": items})
+    return result
+
+
+def model_replies(count=300, seed=6):
+    """Reply texts as models return them: bare JSON, fenced, wrapped in prose, or broken"""
+    rng = random.Random(seed)
+    result = []
+    for i, analysis in enumerate(analyses(count, seed)):
+        text = json.dumps(analysis, indent=2 if i % 2 else None)
+        kind = i % 5
+        if kind == 1:
+            text = f"```json\n{text}\n```"
+        elif kind == 2:
+            text = f"Here is the analysis:\n{text}\nI hope this helps."
+        elif kind == 3:
+            text = text.replace('"Low"', "'Low'").replace('",\n', '",\n,')
+        elif kind == 4:
+            text = text[:rng.randint(len(text) // 2, len(text) - 1)]
+        result.append(text)
+    return result
+
+
+def scores(count=1000, seed=7):
+    """Score values in every format models have been seen to use"""
+    rng = random.Random(seed)
+    makers = [
+        lambda: round(rng.uniform(0, 10), 1),
+        lambda: rng.randint(0, 100),
+        lambda: f"{rng.uniform(0, 10):.1f}",
+        lambda: f"{rng.randint(0, 10)}/10",
+        lambda: f"{rng.randint(0, 100)}/100",
+        lambda: rng.choice([None, "n/a", "", "high"])
+    ]
+    return [rng.choice(makers)() for _ in range(count)]
+
+
+def images(seed=8, large=True):
+    """Encoded product photos: a small flat thumbnail, a busy mid-size shot and (if large) a phone photo"""
+    rng = random.Random(seed)
+    result = []
+    shapes = [((320, 240), False), ((1024, 768), True)] + ([((3024, 4032), True)] if large else [])
+    for size, busy in shapes:
+        image = Image.new("RGB", size, (245, 245, 240))
+        draw = ImageDraw.Draw(image)
+        width, height = size
+        draw.rectangle([width // 4, height // 5, width * 3 // 4, height * 4 // 5], fill=(40, 110, 60))
+        if busy:
+            for _ in range(400):
+                x, y = rng.randrange(width), rng.randrange(height)
+                radius = rng.randint(2, width // 20)
+                color = tuple(rng.randrange(256) for _ in range(3))
+                draw.ellipse([x, y, x + radius, y + radius], fill=color)
+            image = image.filter(ImageFilter.GaussianBlur(1))
+        data = io.BytesIO()
+        image.save(data, format="JPEG", quality=92)
+        result.append(data.getvalue())
+    return result
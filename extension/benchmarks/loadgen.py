@@ -0,0 +1,249 @@
+# loadgen.py
+"""
+Open-loop load generator for the Flask app.
+
+Requests arrive as a Poisson process at a fixed rate, whether or not
+earlier ones have finished, so a saturated server shows up as growing
+latency and errors instead of a politely slower client. Latency is
+measured from each request's scheduled start, which keeps queueing inside
+the generator in the numbers (no coordinated omission).
+
+Start the app against the offline model stand-in, with the per-client
+quotas off (every generated request comes from one IP, so the default
+0.5 model requests/s would answer almost everything with 429), e.g.
+
+    MODEL_BACKEND=fake RECOMMENDATION_OFFLINE=true CLIENT_MODEL_RATE=0 CLIENT_CHEAP_RATE=0 \\
+        gunicorn -w 4 --threads 8 main:app
+
+then step through arrival rates to find where the SLO breaks:
+
+    python benchmarks/loadgen.py http://localhost:5000 --rate 5,10,20,40 --duration 60 \\
+        --mix analyze=5,upload_image=2,alternatives=2,category_products=1 --output run.json
+    python benchmarks/loadgen.py http://localhost:5000 --rate 5,10,20,40 --compare run.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import corpora  # noqa: E402
+
+DEFAULT_MIX = "analyze=5,upload_image=2,alternatives=2,category_products=1"
+
+
+class Traffic:
+    """Builds requests for each route from the synthetic corpora"""
+
+    def __init__(self, base_url, seed=1, unique=False, image_options=None):
+        self.base_url = base_url.rstrip("/")
+        self.rng = random.Random(seed)
+        self.unique = unique
+        self.image_options = image_options or {}
+        self.descriptions = corpora.descriptions(1000, seed)
+        self.categories = corpora.categories(200, seed)
+        # Without the 12MP photo, which would measure upload bandwidth rather than the server
+        self.images = corpora.images(seed, large=False)
+        self._counter = itertools.count()
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _description(self):
+        description = self.rng.choice(self.descriptions)
+        if self.unique:
+            # Defeat the analysis caches so every request reaches the model stand-in
+            description = f"{description} Item {next(self._counter)}."
+        return description
+
+    def build(self, route):
+        """Return (method, url, kwargs) for one request to route"""
+        if route == "analyze":
+            return "POST", f"{self.base_url}/analyze", {"data": {"description": self._description()}}
+        if route == "alternatives":
+            return "POST", f"{self.base_url}/alternatives", {"data": {"description": self._description()}}
+        if route == "category_products":
+            return "GET", f"{self.base_url}/category_products/{self.rng.choice(self.categories)}", {}
+        if route == "upload_image":
+            index = self.rng.randrange(len(self.images))
+            # One file name per client thread and image, so uploads on disk stay bounded
+            filename = f"loadtest-{threading.get_ident()}-{index}.jpg"
+            return "POST", f"{self.base_url}/upload_image", {
+                "data": dict(self.image_options),
+                "files": {"image": (filename, self.images[index], "image/jpeg")}
+            }
+        raise ValueError(f"Unknown route: {route}")
+
+    def send(self, method, url, kwargs, timeout):
+        return self._session().request(method, url, timeout=timeout, **kwargs)
+
+
+def parse_mix(text):
+    """Parse 'route=weight,...' into a dict of weights"""
+    mix = {}
+    for item in text.split(","):
+        route, _, weight = item.partition("=")
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarize(samples, elapsed):
+    """
+    Aggregate (route, status, latency) samples
+
+    Returns:
+        dict: Throughput, error rate and latency percentiles in milliseconds
+    """
+    latencies = sorted(latency for _, _, latency in samples)
+    errors = [status for _, status, _ in samples if not isinstance(status, int) or status >= 400]
+    by_status = {}
+    for _, status, _ in samples:
+        by_status[str(status)] = by_status.get(str(status), 0) + 1
+    return {
+        "requests": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "error_rate": round(len(errors) / len(samples), 4) if samples else 0.0,
+        "status": by_status,
+        "p50_ms": _ms(percentile(latencies, 50)),
+        "p95_ms": _ms(percentile(latencies, 95)),
+        "p99_ms": _ms(percentile(latencies, 99)),
+        "max_ms": _ms(latencies[-1] if latencies else None)
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def run_stage(traffic, mix, rate, duration, max_inflight, timeout, seed):
+    """
+    Drive one arrival rate for a fixed duration
+
+    Returns:
+        dict: Overall and per-route summaries for the stage
+    """
+    rng = random.Random(seed)
+    routes, weights = list(mix), list(mix.values())
+    samples = []
+    samples_lock = threading.Lock()
+    late = 0
+
+    def fire(route, scheduled):
+        method, url, kwargs = traffic.build(route)
+        try:
+            status = traffic.send(method, url, kwargs, timeout).status_code
+        except requests.Timeout:
+            status = "timeout"
+        except requests.RequestException as e:
+            status = type(e).__name__
+        with samples_lock:
+            samples.append((route, status, time.perf_counter() - scheduled))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_inflight, thread_name_prefix="loadgen") as executor:
+        next_at = start
+        while True:
+            next_at += rng.expovariate(rate)
+            if next_at - start >= duration:
+                break
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -0.05:
+                # The generator itself fell behind schedule
+                late += 1
+            executor.submit(fire, rng.choices(routes, weights)[0], next_at)
+    elapsed = time.perf_counter() - start
+
+    result = {"target_rps": rate, "duration": round(elapsed, 2), "late_arrivals": late}
+    result.update(summarize(samples, elapsed))
+    result["routes"] = {
+        route: summarize([sample for sample in samples if sample[0] == route], elapsed)
+        for route in routes
+    }
+    return result
+
+
+def compare(current, baseline):
+    """Print per-rate changes in throughput, error rate and latency percentiles"""
+    baseline_stages = {stage["target_rps"]: stage for stage in baseline["stages"]}
+    fields = ("throughput_rps", "error_rate", "p50_ms", "p95_ms", "p99_ms")
+    print(f"{'rate':>6s}  " + "  ".join(f"{field:>24s}" for field in fields))
+    for stage in current["stages"]:
+        base = baseline_stages.get(stage["target_rps"])
+        cells = []
+        for field in fields:
+            value = stage[field]
+            old = base[field] if base else None
+            cells.append(f"{old} -> {value}".rjust(24) if base else str(value).rjust(24))
+        print(f"{stage['target_rps']:>6g}  " + "  ".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load test for the GreenCart app")
+    parser.add_argument("base_url", help="e.g. http://localhost:5000")
+    parser.add_argument("--rate", default="10", help="Arrival rate(s) in requests/sec, comma-separated for steps")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per rate step")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Traffic mix as route=weight pairs")
+    parser.add_argument("--max-inflight", type=int, default=512, help="Client-side cap on open requests")
+    parser.add_argument("--timeout", type=float, default=60, help="Per-request timeout in seconds")
+    parser.add_argument("--unique", action="store_true", help="Make every description unique to bypass caches")
+    parser.add_argument("--include-formatted", action="store_true", help="Ask /upload_image for formatted HTML")
+    parser.add_argument("--include-alternatives", action="store_true", help="Ask /upload_image for alternatives")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Earlier results JSON file to compare against")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    image_options = {"include_formatted": str(args.include_formatted).lower(),
+                     "include_alternatives": str(args.include_alternatives).lower()}
+    traffic = Traffic(args.base_url, args.seed, args.unique, image_options)
+
+    results = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "base_url": args.base_url,
+        "mix": mix,
+        "stages": []
+    }
+    for rate in (float(r) for r in args.rate.split(",")):
+        print(f"Running {rate:g} req/s for {args.duration:g}s...", file=sys.stderr)
+        stage = run_stage(traffic, mix, rate, args.duration, args.max_inflight, args.timeout, args.seed)
+        results["stages"].append(stage)
+        print(f"  {stage['throughput_rps']} req/s, errors {stage['error_rate']:.1%}, "
+              f"p50 {stage['p50_ms']}ms p95 {stage['p95_ms']}ms p99 {stage['p99_ms']}ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    elif not args.output:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
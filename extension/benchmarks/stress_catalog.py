@@ -0,0 +1,233 @@
+# stress_catalog.py
+"""
+Concurrency stress test for EcoRecommendationEngine.
+
+Writer threads insert products one at a time and in bulk batches while
+reader threads walk catalog snapshots and the public lookups, checking
+that every snapshot is internally consistent: index postings only point
+at visible rows of the right category (the newest ids of each key on
+every read, all of them at the end), the postings add up to the row
+count, and the count never goes backwards. At the end every returned id
+must be unique and resolve to the product that was inserted. The engine
+is warmed up first, and writers keep inserting past --products until the
+run has lasted --min-seconds and readers have done --min-reads reads, so
+reads and writes really overlap. Run from the extension directory:
+
+    python benchmarks/stress_catalog.py                      # defaults
+    python benchmarks/stress_catalog.py --readers 16 --writers 8 --products 5000 --min-seconds 10
+
+tests/test_stress_catalog.py runs a short version under pytest. Exits 1
+if any check fails. Single-insert rates at the start and end of
+the run are printed too. Readers copy out whole categories and compete
+for the GIL, so those rates fall as the catalog grows; with --readers 0
+they show publish cost alone, which stays roughly level (O(1) per product).
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import threading
+import time
+
+EXTENSION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXTENSION_DIR)
+
+CATEGORIES = ["clothing", "electronics", "home", "beauty", "toys", "outdoor", "food", "general"]
+
+
+class Failures:
+    """Thread-safe collector of check failures, keeping the first few messages"""
+
+    def __init__(self, keep=20):
+        self.keep = keep
+        self.count = 0
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def add(self, message):
+        with self._lock:
+            self.count += 1
+            if len(self.messages) < self.keep:
+                self.messages.append(message)
+
+
+def check_snapshot(catalog, failures, sample=None):
+    """
+    Check one published snapshot; returns its row count
+
+    Postings must add up to the row count. With sample set, only the newest
+    ids of each key (where a torn publish would show) are resolved, which
+    keeps a check cheap while the catalog grows; otherwise all of them are.
+    """
+    total = 0
+    for key, postings in catalog.category_index.items():
+        length = len(postings)
+        total += length
+        # Positional reads of the shared array, as Postings.__iter__ does
+        ids = [postings._ids[i] for i in range(max(0, length - sample) if sample else 0, length)]
+        for product_id in ids:
+            if product_id >= catalog.count:
+                failures.add(f"category {key!r} lists id {product_id} beyond the visible {catalog.count} rows")
+                break
+            category = catalog.store[product_id].get("category", "general").lower()
+            if category != key:
+                failures.add(f"id {product_id} is under category {key!r} but has category {category!r}")
+                break
+    if total != catalog.count:
+        failures.add(f"category postings hold {total} ids for {catalog.count} visible rows")
+    return catalog.count
+
+
+def reader(engine, stop, failures, counts, index):
+    rng = random.Random(index)
+    last_count = 0
+    while not stop.is_set():
+        count = check_snapshot(engine._catalog, failures, sample=50)
+        if count < last_count:
+            failures.add(f"row count went backwards from {last_count} to {count}")
+        last_count = count
+
+        category = rng.choice(CATEGORIES)
+        for product in engine.get_catalog_products(category=category):
+            if product.get("category") != category:
+                failures.add(f"get_catalog_products({category!r}) returned a {product.get('category')!r} product")
+                break
+        engine.find_alternatives(rng.choice(['organic cotton hoodie', 'bamboo toothbrush', 'laptop']), category)
+        # Only this reader writes its slot
+        counts[index] += 1
+
+
+def writer(engine, index, products, batch_size, enough, inserted, written, rates):
+    rng = random.Random(index)
+    pending = []
+    single_times = []
+
+    def product(seq):
+        return {
+            "name": f"stress-{index}-{seq}",
+            "description": "Stress test product made from organic cotton",
+            "category": rng.choice(CATEGORIES),
+            "price": round(rng.uniform(1, 100), 2)
+        }
+
+    seq = 0
+    while seq < products or not enough.is_set():
+        if seq % 2 == 0:
+            start = time.perf_counter()
+            product_id = engine.add_product_to_database(product(seq))
+            single_times.append(time.perf_counter() - start)
+            inserted.append((product_id, f"stress-{index}-{seq}"))
+        else:
+            pending.append(product(seq))
+            if len(pending) >= batch_size:
+                engine.bulk_load_products(pending)
+                pending = []
+        seq += 1
+    if pending:
+        engine.bulk_load_products(pending)
+    written[index] = seq
+
+    tenth = max(1, len(single_times) // 10)
+    rates.append((tenth / sum(single_times[:tenth]), tenth / sum(single_times[-tenth:])))
+
+
+def run(readers=8, writers=4, products=2000, batch_size=50, min_seconds=2.0, min_reads=500):
+    from recommendation_engine import EcoRecommendationEngine
+
+    engine = EcoRecommendationEngine(offline=True)
+    # The first lookups pay one-off setup costs; keep them out of the timed, overlapping part
+    engine.find_alternatives("organic cotton hoodie", "clothing")
+    engine.get_catalog_products(category="clothing")
+
+    failures = Failures()
+    stop = threading.Event()
+    enough = threading.Event()
+    inserted = []
+    read_counts = [0] * readers
+    written = [0] * writers
+    rates = []
+
+    reader_threads = [
+        threading.Thread(target=reader, args=(engine, stop, failures, read_counts, i), name=f"reader-{i}")
+        for i in range(readers)
+    ]
+    writer_threads = [
+        threading.Thread(target=writer, args=(engine, i, products, batch_size, enough, inserted, written, rates),
+                         name=f"writer-{i}")
+        for i in range(writers)
+    ]
+
+    start = time.perf_counter()
+    for thread in reader_threads + writer_threads:
+        thread.start()
+    # Writers go on past their quota until readers have had a fair run alongside them
+    while time.perf_counter() - start < min_seconds or sum(read_counts) < min_reads:
+        if not any(thread.is_alive() for thread in reader_threads):
+            break
+        time.sleep(0.01)
+    enough.set()
+    for thread in writer_threads:
+        thread.join()
+    reads_during_writes = sum(read_counts)
+    stop.set()
+    for thread in reader_threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # Ids handed to single inserts are unique and point at the product inserted
+    ids = [product_id for product_id, _ in inserted]
+    if len(set(ids)) != len(ids):
+        failures.add(f"{len(ids) - len(set(ids))} duplicate ids returned by add_product_to_database")
+    store = engine.product_database
+    for product_id, name in inserted:
+        if store[product_id].get("name") != name:
+            failures.add(f"id {product_id} resolves to {store[product_id].get('name')!r}, expected {name!r}")
+
+    expected = sum(written)
+    final_count = check_snapshot(engine._catalog, failures)
+    if final_count != expected:
+        failures.add(f"catalog holds {final_count} products, expected {expected}")
+
+    return {
+        "seconds": round(elapsed, 2),
+        "products": final_count,
+        "reads": sum(read_counts),
+        "reads_during_writes": reads_during_writes,
+        "single_inserts_per_sec_first_10pct": round(sum(first for first, _ in rates) / len(rates), 1),
+        "single_inserts_per_sec_last_10pct": round(sum(last for _, last in rates) / len(rates), 1),
+        "failures": failures.count,
+        "failure_messages": failures.messages
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress EcoRecommendationEngine with concurrent readers and writers")
+    parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+    parser.add_argument("--writers", type=int, default=4, help="Writer threads")
+    parser.add_argument("--products", type=int, default=2000, help="Products inserted per writer")
+    parser.add_argument("--batch-size", type=int, default=50, help="Products per bulk insert")
+    parser.add_argument("--min-seconds", type=float, default=2.0, help="Keep writing for at least this long")
+    parser.add_argument("--min-reads", type=int, default=500, help="Keep writing until readers did this many reads")
+    args = parser.parse_args(argv)
+
+    # The engine logs every insert at DEBUG; keep the output readable
+    logging.disable(logging.CRITICAL)
+    result = run(args.readers, args.writers, args.products, args.batch_size, args.min_seconds, args.min_reads)
+    logging.disable(logging.NOTSET)
+
+    print(f"{result['products']} products, {result['reads']} reads "
+          f"({result['reads_during_writes']} while writing) in {result['seconds']}s; "
+          f"single inserts {result['single_inserts_per_sec_first_10pct']}/s at the start, "
+          f"{result['single_inserts_per_sec_last_10pct']}/s at the end")
+    if result["failures"]:
+        print(f"{result['failures']} check(s) failed:")
+        for message in result["failure_messages"]:
+            print(f"  {message}")
+        return 1
+    print("All checks passed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+# catalog_db.py
+import hashlib
+import json
+import logging
+import time
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import func, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+db = SQLAlchemy()
+
+# Columns stored natively; anything else in a product dict goes into `extra`
+PRODUCT_COLUMNS = ("name", "description", "category", "product_type", "price", "eco_score", "url", "image_url")
+
+
+class CatalogProduct(db.Model):
+    __tablename__ = "catalog_products"
+    __table_args__ = (
+        db.Index("ix_catalog_products_category_type", "category", "product_type"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    product_key = db.Column(db.String(64), nullable=False, unique=True)
+    name = db.Column(db.String(512), nullable=False)
+    description = db.Column(db.Text)
+    category = db.Column(db.String(128), index=True)
+    product_type = db.Column(db.String(128), index=True)
+    price = db.Column(db.Float)
+    eco_score = db.Column(db.Float, index=True)
+    url = db.Column(db.Text)
+    image_url = db.Column(db.Text)
+    extra = db.Column(db.Text)
+    updated_at = db.Column(db.Float, nullable=False, index=True)
+
+
+def product_key(product):
+    """Stable identity for upserts: an explicit sku/id if present, else a hash of name, category and url"""
+    explicit = product.get("product_key") or product.get("sku") or product.get("id")
+    if explicit:
+        return str(explicit)[:64]
+    identity = f"{product.get('name', '')}|{product.get('category', '')}|{product.get('url', '')}"
+    return hashlib.sha1(identity.lower().encode("utf-8")).hexdigest()
+
+
+def engine_options(database_uri):
+    """Connection pool settings for SQLALCHEMY_ENGINE_OPTIONS"""
+    options = {"pool_pre_ping": True, "pool_recycle": 300}
+    if not database_uri.startswith("sqlite"):
+        options.update({"pool_size": 10, "max_overflow": 20, "pool_timeout": 30})
+    return options
+
+
+class SqlCatalogBackend:
+    """
+    Persistent catalog storage shared by every worker.
+
+    Writes are chunked multi-row upserts keyed on product_key; reads fetch
+    rows changed since a watermark so each worker's in-process catalog can
+    act as a read-through cache. An upsert that changes no column leaves the
+    row (and its updated_at) alone, so re-importing a feed does not make
+    every worker pull the whole catalog again.
+    """
+
+    product_key = staticmethod(product_key)
+
+    def __init__(self, app, batch_size=500):
+        self.app = app
+        self.batch_size = batch_size
+        with app.app_context():
+            db.create_all()
+
+    def _upsert_statement(self, rows):
+        table = CatalogProduct.__table__
+        dialect = db.engine.dialect.name
+        if dialect == "postgresql":
+            insert = postgresql.insert(table).values(rows)
+        elif dialect == "sqlite":
+            insert = sqlite.insert(table).values(rows)
+        else:
+            raise ValueError(f"Bulk upserts are not supported on {dialect}")
+
+        updated = {column: insert.excluded[column] for column in PRODUCT_COLUMNS + ("extra", "updated_at")}
+        changed = or_(*(table.c[column].is_distinct_from(insert.excluded[column])
+                        for column in PRODUCT_COLUMNS + ("extra",)))
+        return insert.on_conflict_do_update(index_elements=["product_key"], set_=updated, where=changed) \
+            .returning(table.c.product_key, table.c.updated_at)
+
+    def upsert_products(self, products):
+        """
+        Insert or update products in batches
+
+        Args:
+            products (list): Product dicts (already validated)
+
+        Returns:
+            dict: product_key -> updated_at stored for each product; rows that
+            did not change keep their earlier updated_at
+        """
+        versions = {}
+        now = time.time()
+        rows = {}
+        for product in products:
+            key = product_key(product)
+            extra = {k: v for k, v in product.items() if k not in PRODUCT_COLUMNS and k != "product_key"}
+            row = {column: product.get(column) for column in PRODUCT_COLUMNS}
+            row.update({
+                "product_key": key,
+                "extra": json.dumps(extra, sort_keys=True) if extra else None,
+                "updated_at": now
+            })
+            # A key may appear only once per statement, so the last copy of a duplicate wins
+            rows[key] = row
+
+        rows = list(rows.values())
+        table = CatalogProduct.__table__
+        with self.app.app_context():
+            with db.engine.begin() as conn:
+                for start in range(0, len(rows), self.batch_size):
+                    # Only inserted and changed rows come back
+                    result = conn.execute(self._upsert_statement(rows[start:start + self.batch_size]))
+                    versions.update((key, updated_at) for key, updated_at in result)
+                unchanged = [row["product_key"] for row in rows if row["product_key"] not in versions]
+                for start in range(0, len(unchanged), self.batch_size):
+                    query = select(table.c.product_key, table.c.updated_at) \
+                        .where(table.c.product_key.in_(unchanged[start:start + self.batch_size]))
+                    versions.update((key, updated_at) for key, updated_at in conn.execute(query))
+        return versions
+
+    def fetch_changed(self, since=0.0):
+        """
+        Yield products updated after a watermark, oldest change first
+
+        Yields:
+            tuple: (product dict including product_key, updated_at)
+        """
+        query = select(CatalogProduct.__table__).where(CatalogProduct.updated_at > since) \
+            .order_by(CatalogProduct.updated_at, CatalogProduct.id)
+
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                for row in conn.execution_options(yield_per=self.batch_size).execute(query).mappings():
+                    product = json.loads(row["extra"]) if row["extra"] else {}
+                    product.update({column: row[column] for column in PRODUCT_COLUMNS if row[column] is not None})
+                    product["product_key"] = row["product_key"]
+                    yield product, row["updated_at"]
+
+    def count(self):
+        """Number of products stored"""
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                return conn.execute(select(func.count()).select_from(CatalogProduct.__table__)).scalar()
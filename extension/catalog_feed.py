@@ -0,0 +1,27 @@
+# catalog_feed.py
+import csv
+import json
+
+
+def iter_records(path, fmt="auto"):
+    """
+    Lazily yield records from a CSV or JSONL file
+
+    Args:
+        path (str): The input file
+        fmt (str): "csv", "jsonl" or "auto" to decide from the file extension
+
+    Yields:
+        dict: One record per input row
+    """
+    if fmt == "auto":
+        fmt = "csv" if path.lower().endswith(".csv") else "jsonl"
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
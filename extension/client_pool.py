@@ -0,0 +1,232 @@
+# client_pool.py
+import logging
+import threading
+import time
+
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+from google.generativeai.types import GenerateContentResponse, content_types, generation_types
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class PoolExhaustedError(RuntimeError):
+    """Raised when no key can accept another call before the acquire timeout"""
+
+
+class _Endpoint:
+    """One (API key, model) pair with its own adaptive concurrency limit"""
+
+    def __init__(self, key_index, model_name, weight, initial_limit):
+        self.key_index = key_index
+        self.model_name = model_name
+        self.weight = weight
+        self.current_weight = 0
+        self.limit = float(initial_limit)
+        self.inflight = 0
+        self.throttled_until = 0.0
+        self.latency_ewma = None
+        self.calls = 0
+        self.throttles = 0
+        self.errors = 0
+
+
+class GeminiClientPool:
+    """
+    Spread generate_content calls across several API keys.
+
+    Each (key, model) pair is an endpoint picked by smooth weighted
+    round-robin. Endpoints keep an AIMD concurrency limit: it grows by
+    1/limit after each fast success and is cut multiplicatively on a 429 or
+    a slow reply. A 429 also takes the endpoint out of rotation for a while.
+
+    Each key has its own GenerativeServiceClient, built with the key in its
+    client options, so calls on different keys never share the SDK's
+    process-wide configuration. Requests and responses go through the same
+    SDK helpers GenerativeModel uses, so callers get the usual response.
+    """
+
+    def __init__(self, api_keys, weights=None, initial_limit=4, min_limit=1, max_limit=32,
+                 latency_target=15.0, throttle_seconds=30.0, acquire_timeout=30.0):
+        if not api_keys:
+            raise ValueError("At least one API key is required")
+        if weights and len(weights) != len(api_keys):
+            raise ValueError("weights must have one entry per API key")
+
+        self.api_keys = list(api_keys)
+        self.weights = list(weights) if weights else [1] * len(self.api_keys)
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.throttle_seconds = throttle_seconds
+        self.acquire_timeout = acquire_timeout
+
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+        self._endpoints = {}
+        self._cond = threading.Condition()
+
+    @classmethod
+    def from_env(cls, env):
+        """
+        Build a pool from environment settings
+
+        GOOGLE_API_KEYS holds a comma-separated list of keys (falling back to
+        GOOGLE_API_KEY) and GOOGLE_API_KEY_WEIGHTS optional integer weights.
+        """
+        keys = [k.strip() for k in env.get("GOOGLE_API_KEYS", "").split(",") if k.strip()]
+        if not keys and env.get("GOOGLE_API_KEY"):
+            keys = [env["GOOGLE_API_KEY"]]
+
+        weights = [int(w) for w in env.get("GOOGLE_API_KEY_WEIGHTS", "").split(",") if w.strip()] or None
+
+        return cls(
+            keys,
+            weights=weights,
+            initial_limit=int(env.get("GEMINI_POOL_INITIAL_LIMIT", "4")),
+            max_limit=int(env.get("GEMINI_POOL_MAX_LIMIT", "32")),
+            latency_target=float(env.get("GEMINI_POOL_LATENCY_TARGET", "15")),
+            throttle_seconds=float(env.get("GEMINI_POOL_THROTTLE_SECONDS", "30"))
+        )
+
+    def _endpoints_for(self, model_name):
+        # Called with the condition held
+        if model_name not in self._endpoints:
+            self._endpoints[model_name] = [
+                _Endpoint(i, model_name, weight, self.initial_limit)
+                for i, weight in enumerate(self.weights)
+            ]
+        return self._endpoints[model_name]
+
+    def _client(self, key_index):
+        client = self._clients.get(key_index)
+        if client is None:
+            # Building a client opens no connection, so holding the lock here is cheap
+            with self._clients_lock:
+                client = self._clients.get(key_index)
+                if client is None:
+                    client = glm.GenerativeServiceClient(client_options={"api_key": self.api_keys[key_index]})
+                    self._clients[key_index] = client
+        return client
+
+    def _generate(self, endpoint, contents, generation_config=None, request_options=None):
+        model_name = endpoint.model_name
+        request = glm.GenerateContentRequest(
+            model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+            contents=content_types.to_contents(contents),
+            generation_config=generation_types.to_generation_config_dict(generation_config)
+        )
+        if request.contents and not request.contents[-1].role:
+            request.contents[-1].role = "user"
+        response = self._client(endpoint.key_index).generate_content(request, **(request_options or {}))
+        return GenerateContentResponse.from_response(response)
+
+    def _acquire(self, model_name, exclude=()):
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                now = time.time()
+                candidates = [
+                    ep for ep in self._endpoints_for(model_name)
+                    if ep.key_index not in exclude
+                    and ep.throttled_until <= now
+                    and ep.inflight < int(ep.limit)
+                ]
+                if candidates:
+                    # Smooth weighted round-robin (as used by nginx upstreams)
+                    total = sum(ep.weight for ep in candidates)
+                    for ep in candidates:
+                        ep.current_weight += ep.weight
+                    chosen = max(candidates, key=lambda ep: ep.current_weight)
+                    chosen.current_weight -= total
+                    chosen.inflight += 1
+                    return chosen
+
+                remaining = deadline - time.monotonic()
+                eligible = [ep for ep in self._endpoints_for(model_name) if ep.key_index not in exclude]
+                # Fail fast when every usable key stays throttled past the deadline
+                if remaining <= 0 or all(ep.throttled_until - now >= remaining for ep in eligible):
+                    raise PoolExhaustedError(f"No API key available for {model_name}")
+
+                # Wake up when a call finishes or the earliest throttle expires
+                throttled = [ep.throttled_until - now for ep in eligible if ep.throttled_until > now]
+                self._cond.wait(min([remaining] + throttled))
+
+    def _release(self, endpoint, latency=None, throttled=False, failed=False):
+        with self._cond:
+            endpoint.inflight -= 1
+            endpoint.calls += 1
+
+            if throttled:
+                endpoint.throttles += 1
+                endpoint.limit = max(self.min_limit, endpoint.limit * 0.5)
+                endpoint.throttled_until = time.time() + self.throttle_seconds
+                logger.warning(f"API key #{endpoint.key_index} throttled on {endpoint.model_name}, "
+                               f"limit now {endpoint.limit:.1f}")
+            elif failed:
+                endpoint.errors += 1
+            else:
+                endpoint.latency_ewma = latency if endpoint.latency_ewma is None \
+                    else 0.8 * endpoint.latency_ewma + 0.2 * latency
+                if latency > self.latency_target:
+                    endpoint.limit = max(self.min_limit, endpoint.limit * 0.9)
+                else:
+                    endpoint.limit = min(self.max_limit, endpoint.limit + 1 / endpoint.limit)
+
+            self._cond.notify_all()
+
+    def generate_content(self, model_name, contents, **kwargs):
+        """
+        Call generate_content on the next available key for a model
+
+        A 429 from one key is retried once on each of the other keys.
+
+        Args:
+            model_name (str): The Gemini model to call
+            contents: The prompt or multimodal parts to send
+
+        Returns:
+            The model response
+        """
+        tried = set()
+        while True:
+            endpoint = self._acquire(model_name, exclude=tried)
+            start_time = time.time()
+            try:
+                response = self._generate(endpoint, contents, **kwargs)
+            except google_exceptions.ResourceExhausted:
+                self._release(endpoint, throttled=True)
+                tried.add(endpoint.key_index)
+                if len(tried) >= len(self.api_keys):
+                    raise
+                continue
+            except Exception:
+                self._release(endpoint, failed=True)
+                raise
+
+            self._release(endpoint, latency=time.time() - start_time)
+            return response
+
+    def stats(self):
+        """Return per-key, per-model limits and counters for monitoring"""
+        now = time.time()
+        with self._cond:
+            return [
+                {
+                    "key": ep.key_index,
+                    "model": model_name,
+                    "weight": ep.weight,
+                    "limit": round(ep.limit, 2),
+                    "inflight": ep.inflight,
+                    "throttled": ep.throttled_until > now,
+                    "latency_ewma": round(ep.latency_ewma, 4) if ep.latency_ewma is not None else None,
+                    "calls": ep.calls,
+                    "throttles": ep.throttles,
+                    "errors": ep.errors
+                }
+                for model_name, endpoints in self._endpoints.items()
+                for ep in endpoints
+            ]
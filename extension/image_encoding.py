@@ -0,0 +1,123 @@
+# image_encoding.py
+import io
+import logging
+import time
+
+from PIL import Image, ImageFilter, ImageStat, features
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Formats tried for vision uploads, most compact first
+CANDIDATE_FORMATS = [fmt for fmt in ("WEBP", "JPEG") if fmt != "WEBP" or features.check("webp")]
+
+
+def _flatten(image):
+    """Drop alpha onto a white background and copy pixels only, leaving metadata behind"""
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[-1])
+        return background
+    return image.convert("RGB")
+
+
+def estimate_complexity(image):
+    """
+    Estimate visual complexity as the mean edge strength of a small grayscale copy
+
+    Args:
+        image (PIL.Image): The image to measure
+
+    Returns:
+        float: Mean edge intensity (0-255); product shots on plain backgrounds score low
+    """
+    preview = image.convert("L")
+    preview.thumbnail((256, 256))
+    return ImageStat.Stat(preview.filter(ImageFilter.FIND_EDGES)).mean[0]
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == "WEBP":
+        image.save(buffer, format=fmt, quality=quality, method=4)
+    else:
+        image.save(buffer, format=fmt, quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _best_under_budget(image, fmt, byte_budget, min_quality, max_quality):
+    """Binary search the highest quality that fits the byte budget"""
+    # Most images already fit at full quality, so try that before searching
+    data = _encode(image, fmt, max_quality)
+    if len(data) <= byte_budget:
+        return fmt, max_quality, data
+
+    low, high = min_quality, max_quality - 1
+    best = None
+    while low <= high:
+        quality = (low + high) // 2
+        data = _encode(image, fmt, quality)
+        if len(data) <= byte_budget:
+            best = (fmt, quality, data)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+def encode_for_vision(image, byte_budget=150000, min_quality=40, max_quality=85,
+                      simple_max_side=512, simple_threshold=12.0):
+    """
+    Re-encode an image into the cheapest acceptable payload for a vision request
+
+    Metadata is stripped, simple images are downscaled further, and each
+    candidate format is searched for the highest quality under the byte
+    budget. If nothing fits, the image is shrunk and the search repeated.
+
+    Args:
+        image (PIL.Image): The image to encode
+        byte_budget (int): Target maximum payload size in bytes
+        min_quality (int): Lowest quality considered acceptable
+        max_quality (int): Highest quality tried
+        simple_max_side (int): Longest side for low-complexity images
+        simple_threshold (float): Complexity below which an image counts as simple
+
+    Returns:
+        tuple: (image bytes, mime type, stats dict)
+    """
+    start_time = time.time()
+    working = _flatten(image)
+
+    complexity = estimate_complexity(working)
+    if complexity < simple_threshold and max(working.size) > simple_max_side:
+        working.thumbnail((simple_max_side, simple_max_side), Image.LANCZOS)
+
+    chosen = None
+    for _ in range(4):
+        fits = [result for result in (
+            _best_under_budget(working, fmt, byte_budget, min_quality, max_quality)
+            for fmt in CANDIDATE_FORMATS
+        ) if result]
+        if fits:
+            # Prefer the higher quality, then the smaller payload
+            chosen = max(fits, key=lambda result: (result[1], -len(result[2])))
+            break
+        working = working.resize((max(1, working.width * 3 // 4), max(1, working.height * 3 // 4)), Image.LANCZOS)
+
+    if chosen is None:
+        # Still over budget after shrinking; send the smallest acceptable encoding
+        chosen = min(((fmt, min_quality, _encode(working, fmt, min_quality)) for fmt in CANDIDATE_FORMATS),
+                     key=lambda result: len(result[2]))
+
+    fmt, quality, data = chosen
+    stats = {
+        "format": fmt,
+        "quality": quality,
+        "size": working.size,
+        "complexity": round(complexity, 2),
+        "encoded_bytes": len(data),
+        "encode_seconds": round(time.time() - start_time, 4)
+    }
+    return data, f"image/{fmt.lower()}", stats
@@ -0,0 +1,171 @@
+# image_similarity.py
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from PIL import Image
+
+from similarity_index import MultiIndexHash
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+
+
+def perceptual_hash(image):
+    """
+    Compute a 64-bit difference hash (dHash) of an image
+
+    The image is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right-hand neighbour, so the hash
+    survives rescaling, recompression and small colour changes.
+
+    Args:
+        image (PIL.Image): The image to hash
+
+    Returns:
+        int: The 64-bit hash
+    """
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+class ImageSimilarityIndex:
+    """
+    Thread-safe perceptual-hash index mapping images to stored payloads
+    (catalog products), searched with a MultiIndexHash over the 64-bit hashes.
+    """
+
+    def __init__(self, max_distance=6):
+        self.max_distance = max_distance
+        self._hashes = MultiIndexHash(HASH_BITS, max_distance)
+        self._payloads = []
+        self._slots = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def add(self, image_hash, payload, key=None):
+        """
+        Store a payload under an image hash
+
+        Args:
+            image_hash (int): The perceptual hash of the image
+            payload (dict): The data to return for similar images
+            key (str): Identifies the image (e.g. its URL); adding a key
+                again replaces its hash and payload
+        """
+        with self._lock:
+            slot = self._slots.get(key, len(self._payloads)) if key is not None else len(self._payloads)
+            self._hashes.set(slot, image_hash)
+            if slot < len(self._payloads):
+                self._payloads[slot] = payload
+            else:
+                self._payloads.append(payload)
+            if key is not None:
+                self._slots[key] = slot
+
+    def lookup(self, image):
+        """
+        Find the closest stored image within the threshold
+
+        Args:
+            image (PIL.Image or int): The image, or its perceptual hash
+
+        Returns:
+            dict: The stored payload and match details, or None on a miss
+        """
+        image_hash = image if isinstance(image, int) else perceptual_hash(image)
+
+        with self._lock:
+            nearest = self._hashes.nearest(image_hash)
+            if nearest is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            best_slot, best_distance = nearest
+            payload = self._payloads[best_slot]
+
+        return {
+            "payload": payload,
+            "match": {
+                "type": "exact" if best_distance == 0 else "near_duplicate",
+                "distance": best_distance,
+                "similarity": round(1 - best_distance / HASH_BITS, 4),
+                "threshold": self.max_distance
+            }
+        }
+
+    def stats(self):
+        """Return hit/miss counters and occupancy for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._payloads),
+                "max_distance": self.max_distance,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+class ImageHashCache:
+    """
+    Perceptual hashes of image URLs in SQLite, shared by every worker.
+
+    Each worker builds its own in-memory index, but only the first one to
+    see a URL downloads the image; the others read its hash from here.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS image_hashes (
+                    url TEXT PRIMARY KEY,
+                    hash INTEGER NOT NULL,
+                    hashed_at REAL NOT NULL
+                )
+            """)
+
+    def get_many(self, urls):
+        """Return {url: hash} for the URLs already hashed"""
+        urls = list(urls)
+        found = {}
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(urls), 500):
+                chunk = urls[i:i + 500]
+                rows = conn.execute(
+                    f"SELECT url, hash FROM image_hashes WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                )
+                # SQLite integers are signed; hashes are stored as their two's complement
+                found.update((url, value & 0xFFFFFFFFFFFFFFFF) for url, value in rows)
+        return found
+
+    def put_many(self, hashes):
+        """Store {url: hash} pairs"""
+        if not hashes:
+            return
+        now = time.time()
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO image_hashes (url, hash, hashed_at) VALUES (?, ?, ?)",
+                [(url, value - (1 << 64) if value >= 1 << 63 else value, now) for url, value in hashes.items()]
+            )
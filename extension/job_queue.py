@@ -0,0 +1,263 @@
+# job_queue.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from sqlite_util import Transaction
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a bounded pool of worker threads.
+
+    Jobs are persisted before their id is returned, and a running job holds
+    a lease; if the worker dies the lease expires and the job is picked up
+    again, so queued and interrupted work survives a restart. Several
+    processes may share the same database file.
+
+    Each claim writes a fresh lease token, and a worker only records its
+    result while the job still carries its token, so a worker that outlived
+    its lease cannot overwrite the run that took the job over. Worker
+    threads are started per process by start(), which is safe to call on
+    every request: threads started before a fork do not exist in the child.
+    """
+
+    def __init__(self, db_path, handlers, workers=4, lease_seconds=600, max_attempts=3, poll_interval=0.5):
+        self.db_path = db_path
+        self.handlers = handlers
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+
+        self._local = threading.local()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._started_pid = None
+        self._start_lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    task TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    image BLOB,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    lease_owner TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            # Databases created before leases carried an owner
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lease_owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease_owner TEXT")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return Transaction(conn)
+
+    def start(self):
+        """Start the worker threads in this process (a no-op once they are running)"""
+        if self._started_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._started_pid == os.getpid():
+                return
+            # Connections and threads inherited from a parent process are unusable here
+            self._local = threading.local()
+            self._wakeup = threading.Condition()
+            self._threads = []
+            self._stopping = False
+            self._start_workers()
+            self._started_pid = os.getpid()
+
+    def _start_workers(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.workers} job workers on {self.db_path}")
+
+    def stop(self):
+        """Ask worker threads to exit after their current job"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def submit(self, task, payload, image=None):
+        """
+        Persist a new job and wake a worker
+
+        Args:
+            task (str): One of the registered handler names
+            payload (dict): JSON-serializable task arguments
+            image (bytes): Optional image data for image tasks
+
+        Returns:
+            str: The job id
+        """
+        if task not in self.handlers:
+            raise ValueError(f"Unknown task: {task}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, task, payload, image, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, task, json.dumps(payload), image, now, now)
+            )
+
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id):
+        """
+        Look up a job
+
+        Returns:
+            dict: The job's status and, once finished, its result or error; None if unknown
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, task, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        job = {
+            "id": row["id"],
+            "task": row["task"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"]
+        }
+        if row["result"] is not None:
+            job["result"] = json.loads(row["result"])
+        if row["error"] is not None:
+            job["error"] = row["error"]
+        return job
+
+    def events(self, job_id, timeout=600):
+        """
+        Yield Server-Sent Events for a job until it finishes
+
+        Args:
+            job_id (str): The job to follow
+            timeout (float): Stop following after this many seconds
+        """
+        deadline = time.time() + timeout
+        last_status = None
+        while time.time() < deadline:
+            job = self.get(job_id)
+            if job is None:
+                yield f"event: error\ndata: {json.dumps({'error': 'Job not found'})}\n\n"
+                return
+
+            if job["status"] != last_status:
+                last_status = job["status"]
+                yield f"event: status\ndata: {json.dumps(job)}\n\n"
+                if last_status in TERMINAL_STATUSES:
+                    return
+            else:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+
+            time.sleep(self.poll_interval)
+
+    def _claim(self):
+        """Atomically take the oldest queued (or lease-expired) job under a new lease token"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Give up on jobs whose worker keeps dying mid-run
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Job exceeded maximum attempts', image = NULL, "
+                "lease_until = NULL, lease_owner = NULL, updated_at = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, task, payload, image FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            lease = uuid.uuid4().hex
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, lease_until = ?, lease_owner = ?, "
+                "updated_at = ? WHERE id = ?",
+                (now + self.lease_seconds, lease, now, row["id"])
+            )
+            return dict(row, lease=lease)
+
+    def _finish(self, job_id, lease, result=None, error=None):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, image = NULL, lease_until = NULL, "
+                "lease_owner = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                ("failed" if error is not None else "succeeded",
+                 json.dumps(result) if error is None else None,
+                 error, time.time(), job_id, lease)
+            )
+        if cursor.rowcount == 0:
+            logger.warning(f"Dropped result of job {job_id}: its lease expired and another worker took it over")
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming job: {e}")
+                job = None
+
+            if job is None:
+                # Other processes may enqueue too, so poll as well as waiting for a notify
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(self.poll_interval)
+                continue
+
+            logger.debug(f"Running job {job['id']} ({job['task']})")
+            try:
+                result = self.handlers[job["task"]](json.loads(job["payload"]), job["image"])
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {e}")
+                result = {"error": str(e)}
+            try:
+                # Handlers report failures as {"error": ...} as well as by raising
+                if isinstance(result, dict) and "error" in result:
+                    self._finish(job["id"], job["lease"], error=str(result["error"]))
+                else:
+                    self._finish(job["id"], job["lease"], result=result)
+            except sqlite3.Error as e:
+                logger.error(f"Error recording result of job {job['id']}: {e}")
@@ -0,0 +1,350 @@
+# metrics.py
+import atexit
+import functools
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits up to slow model calls and scrapes
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = registry.lock
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def snapshot(self):
+        with self._lock:
+            return {json.dumps(key): value if not isinstance(value, list) else list(value)
+                    for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, such as requests in flight"""
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def track_inprogress(self, **labels):
+        """Context manager counting the calls currently inside the block"""
+        return _InProgress(self, labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observations in fixed buckets, plus their sum and count"""
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket (non-cumulative) counts, then sum and count
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 3)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            else:
+                state[len(self.buckets)] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def time(self, **labels):
+        """Context manager (or decorator) observing the wall-clock time of a block"""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timer(self.histogram, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class _InProgress:
+    def __init__(self, gauge, labels):
+        self.gauge = gauge
+        self.labels = labels
+
+    def __enter__(self):
+        self.gauge.inc(**self.labels)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.gauge.dec(**self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """
+    In-process metrics with optional multi-process aggregation.
+
+    Updates only touch in-memory dicts. When a directory is configured,
+    each process periodically writes its values to metrics-<pid>.json there
+    and an exposition sums the files of every worker. Counters and
+    histograms of exited workers are kept so totals never go backwards;
+    their gauges are dropped. Values counted before a fork stay with the
+    parent, so workers forked from a preloading master start from zero.
+    """
+
+    def __init__(self, directory=None, flush_interval=5.0):
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._metrics = {}
+        self._flusher = None
+        self._flusher_pid = None
+
+        # A forked worker must not re-report values it inherited from the parent
+        os.register_at_fork(before=self._before_fork, after_in_parent=self.lock.release,
+                            after_in_child=self._after_fork_in_child)
+
+    def _before_fork(self):
+        try:
+            self.flush()
+        except OSError as e:
+            logger.error(f"Error writing metrics: {e}")
+        self.lock.acquire()
+
+    def _after_fork_in_child(self):
+        for metric in self._metrics.values():
+            metric._values.clear()
+        self._flusher = None
+        self._flusher_pid = None
+        self.lock.release()
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def start(self):
+        """Start writing this process's values to the shared directory (call after forking)"""
+        if not self.directory or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+        atexit.register(self.flush)
+        self._flusher = threading.Thread(target=self._flush_loop, name="metrics-flush", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error(f"Error writing metrics: {e}")
+
+    def flush(self):
+        """Atomically write this process's values to the shared directory"""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        data = {"pid": os.getpid(), "metrics": {name: metric.snapshot() for name, metric in self._metrics.items()}}
+        path = os.path.join(self.directory, f"metrics-{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def _collect(self):
+        """Merge values from every process (or just this one), keyed by metric name"""
+        if not self.directory:
+            return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+        self.flush()
+        merged = {name: {} for name in self._metrics}
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            alive = _pid_alive(data.get("pid"))
+            for name, values in data.get("metrics", {}).items():
+                metric = self._metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                target = merged[name]
+                for key, value in values.items():
+                    if isinstance(value, list):
+                        current = target.setdefault(key, [0] * len(value))
+                        for i, item in enumerate(value):
+                            current[i] += item
+                    else:
+                        target[key] = target.get(key, 0) + value
+        return merged
+
+    def exposition(self):
+        """Render every metric in the Prometheus text format"""
+        lines = []
+        for name, values in self._collect().items():
+            metric = self._metrics[name]
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key in sorted(values):
+                labelvalues = json.loads(key)
+                value = values[key]
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_format_labels(metric.labelnames, labelvalues)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float("inf"),), value):
+                    cumulative += count
+                    le = ("le", _format_value(bound))
+                    lines.append(f"{name}_bucket{_format_labels(metric.labelnames, labelvalues, le)} {cumulative}")
+                labels = _format_labels(metric.labelnames, labelvalues)
+                lines.append(f"{name}_sum{labels} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{labels} {_format_value(value[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# Shared registry; METRICS_DIR enables aggregation across gunicorn workers
+registry = MetricsRegistry(
+    directory=os.environ.get("METRICS_DIR") or os.environ.get("PROMETHEUS_MULTIPROC_DIR"),
+    flush_interval=float(os.environ.get("METRICS_FLUSH_SECONDS", "5"))
+)
+
+HTTP_REQUESTS = registry.counter(
+    "greencart_http_requests_total", "HTTP requests by route, method and status", ["route", "method", "status"]
+)
+HTTP_LATENCY = registry.histogram(
+    "greencart_http_request_seconds", "Time to produce an HTTP response", ["route", "method"]
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "greencart_http_requests_in_flight", "HTTP requests currently being handled", ["route"]
+)
+STAGE_LATENCY = registry.histogram(
+    "greencart_stage_seconds", "Latency of internal processing stages", ["stage"]
+)
+MODEL_CALLS = registry.counter(
+    "greencart_model_calls_total", "Model API calls by model and outcome", ["model", "outcome"]
+)
+MODEL_IN_FLIGHT = registry.gauge(
+    "greencart_model_calls_in_flight", "Model API calls currently waiting for a response", ["model"]
+)
+CACHE_LOOKUPS = registry.counter(
+    "greencart_cache_lookups_total", "Cache lookups by cache and result (hit or miss)", ["cache", "result"]
+)
+MODEL_TOKENS = registry.counter(
+    "greencart_model_tokens_total", "Model tokens by endpoint, model and kind (prompt or output)",
+    ["endpoint", "model", "kind"]
+)
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    "greencart_admission_queue_depth", "Requests waiting for an admission slot", ["route_class"]
+)
+ADMISSION_REJECTED = registry.counter(
+    "greencart_admission_rejected_total", "Requests rejected with 429 by route class and reason",
+    ["route_class", "reason"]
+)
+BROWNOUT_ACTIVE = registry.gauge(
+    "greencart_brownout_active", "1 while model-backed routes serve cached or local results (summed over workers)"
+)
+BROWNOUT_RESPONSES = registry.counter(
+    "greencart_brownout_responses_total", "Model-backed requests served degraded during a brownout", ["route"]
+)
+CLIENT_RATE_LIMITED = registry.counter(
+    "greencart_client_rate_limited_total", "Requests rejected with 429 for exceeding a per-client quota",
+    ["route_class"]
+)
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup; the hit ratio is hits / (hits + misses)"""
+    CACHE_LOOKUPS.inc(cache=cache, result="hit" if hit else "miss")
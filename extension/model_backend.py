@@ -0,0 +1,356 @@
+# model_backend.py
+"""
+Model backends for SustainabilityAnalyzer.
+
+A backend exposes generate_content(model_name, contents), returning an
+object with .text and .usage_metadata like a Gemini response, and stats().
+GeminiClientPool is the real backend. FakeModelBackend answers offline,
+replaying recorded responses from a cassette or synthesizing valid JSON,
+with configurable latency, error and malformed-output rates.
+RecordingBackend wraps a real backend and appends every response to a
+cassette for later replay.
+
+MODEL_BACKEND selects "gemini" (default), "fake" or "record"; the fake
+backend needs no GOOGLE_API_KEY.
+"""
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+from client_pool import GeminiClientPool
+from prompts import estimate_tokens
+from usage_ledger import normalize_model_name
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("gemini", "fake", "record")
+
+# Roughly what Gemini charges for one image part
+IMAGE_TOKENS = 258
+
+
+def content_key(contents, model_name=None):
+    """
+    Stable key for a request, hashing image parts by their bytes
+
+    Args:
+        contents: A prompt string or a list of strings and {"mime_type", "data"} parts
+        model_name (str): The model called, so the same prompt sent to two models
+            (e.g. a routed call and its escalation) gets two keys
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    digest = hashlib.sha256()
+    if model_name is not None:
+        digest.update(normalize_model_name(model_name).encode("utf-8"))
+        digest.update(b"\0")
+    for part in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if isinstance(part, dict):
+            digest.update(part.get("mime_type", "").encode("utf-8"))
+            digest.update(hashlib.sha256(part.get("data", b"")).digest())
+        else:
+            digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _prompt_text(contents):
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    return "\n".join(str(part) for part in parts if not isinstance(part, dict))
+
+
+def _image_count(contents):
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    return sum(1 for part in parts if isinstance(part, dict))
+
+
+class FakeUsage:
+    def __init__(self, prompt_token_count=0, candidates_token_count=0):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+
+class FakeResponse:
+    """The parts of a Gemini response the analyzer reads"""
+
+    def __init__(self, text, usage_metadata=None):
+        self.text = text
+        self.usage_metadata = usage_metadata
+
+
+class Cassette:
+    """
+    Recorded responses in a JSONL file, keyed by content_key(contents, model_name)
+
+    Entries recorded before keys included the model (no "key_version") are
+    still found by their prompt alone when no model-specific entry exists.
+    """
+
+    KEY_VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._legacy = {}
+        try:
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries = self._entries if entry.get("key_version") == self.KEY_VERSION else self._legacy
+                        entries[entry["key"]] = entry
+            logger.info(f"Loaded {len(self)} recorded responses from {path}")
+        except FileNotFoundError:
+            pass
+
+    def __len__(self):
+        return len(self._entries) + len(self._legacy)
+
+    def get(self, key, legacy_key=None):
+        entry = self._entries.get(key)
+        if entry is None and legacy_key is not None:
+            entry = self._legacy.get(legacy_key)
+        return entry
+
+    def append(self, entry):
+        with self._lock:
+            self._entries[entry["key"]] = entry
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+def _score(rng, low=1.0, high=10.0):
+    return round(rng.uniform(low, high), 1)
+
+
+def _synthesize_sustainability(rng, name="Sample product"):
+    return {
+        "image_analysis": {
+            "product_name": name,
+            "description": f"A {name.lower()} photographed on a plain background.",
+            "visible_materials": rng.sample(["plastic", "cotton", "glass", "aluminium", "cardboard", "bamboo"], 2),
+            "visible_claims": rng.sample(["eco-friendly", "recyclable", "organic", "BPA free"], rng.randint(0, 2))
+        },
+        "sustainability_analysis": {
+            "materials_sustainability": _score(rng),
+            "packaging_sustainability": _score(rng),
+            "greenwashing_risk": rng.choice(["Low", "Medium", "High"]),
+            "improvement_suggestions": ["Use recycled materials", "Reduce packaging"],
+            "overall_sustainability_score": _score(rng),
+            "sustainability_justification": "Synthetic assessment from the fake model backend."
+        }
+    }
+
+
+def synthesize(contents, rng):
+    """
+    Build a plausible JSON reply for the prompt, following the shape it asks for
+
+    Returns:
+        dict: The reply object
+    """
+    text = _prompt_text(contents)
+    if "box_2d" in text:
+        count = rng.randint(1, 3)
+        products = []
+        for i in range(count):
+            left = i * (1000 // count)
+            products.append({"product_name": f"Product {i + 1}", "box_2d": [100, left + 20, 900, left + 1000 // count - 20]})
+        return {"products": products}
+    if "multiple_products" in text:
+        products = [_synthesize_sustainability(rng, f"Product {i + 1}") for i in range(rng.randint(1, 3))]
+        return {"multiple_products": True, "product_count": len(products), "products": products}
+    if "image_analysis" in text:
+        return _synthesize_sustainability(rng)
+    if "greenwashing" in text.lower():
+        return {
+            "greenwashing_risk": rng.choice(["Low", "Medium", "High"]),
+            "issues": ["Claims are not backed by certification"],
+            "vague_claims": ["eco-friendly"],
+            "misleading_terms": [],
+            "missing_information": ["Material sourcing"],
+            "explanation": "Synthetic assessment from the fake model backend.",
+            "recommendations": ["Cite third-party certifications"]
+        }
+    return {
+        "materials_sustainability": _score(rng),
+        "manufacturing_process": _score(rng),
+        "carbon_footprint": _score(rng),
+        "recyclability": _score(rng),
+        "overall_sustainability_score": _score(rng),
+        "improvement_opportunities": ["Use recycled materials"],
+        "sustainability_tags": {"Eco-Friendly": rng.random() < 0.5, "Recyclable": rng.random() < 0.5,
+                                "Plastic Packaging": rng.random() < 0.5},
+        "sustainability_justification": "Synthetic assessment from the fake model backend."
+    }
+
+
+class FakeModelBackend:
+    """
+    Offline stand-in for the Gemini API.
+
+    Requests found in the cassette replay the recorded text and token usage
+    (and, with replay_latency, the recorded latency); others get a
+    synthesized reply that is deterministic for the same prompt. Latency is
+    otherwise log-normal around latency_ms; error_rate fails calls with 503s,
+    throttle_rate with 429s, and malformed_rate returns text the JSON parser
+    has to reject or repair.
+    """
+
+    offline = True
+
+    def __init__(self, cassette=None, latency_ms=800.0, latency_sigma=0.5, error_rate=0.0,
+                 throttle_rate=0.0, malformed_rate=0.0, on_miss="synthesize", seed=None, replay_latency=False):
+        if on_miss not in ("synthesize", "error"):
+            raise ValueError("on_miss must be 'synthesize' or 'error'")
+        self.cassette = cassette
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.malformed_rate = malformed_rate
+        self.on_miss = on_miss
+        self.seed = seed
+        self.replay_latency = replay_latency
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "replayed": 0, "synthesized": 0, "errors": 0, "throttled": 0, "malformed": 0}
+
+    @classmethod
+    def from_env(cls, env):
+        """Build a fake backend from MODEL_CASSETTE and the FAKE_MODEL_* settings"""
+        cassette_path = env.get("MODEL_CASSETTE")
+        seed = env.get("FAKE_MODEL_SEED")
+        return cls(
+            cassette=Cassette(cassette_path) if cassette_path else None,
+            latency_ms=float(env.get("FAKE_MODEL_LATENCY_MS", "800")),
+            latency_sigma=float(env.get("FAKE_MODEL_LATENCY_SIGMA", "0.5")),
+            error_rate=float(env.get("FAKE_MODEL_ERROR_RATE", "0")),
+            throttle_rate=float(env.get("FAKE_MODEL_THROTTLE_RATE", "0")),
+            malformed_rate=float(env.get("FAKE_MODEL_MALFORMED_RATE", "0")),
+            on_miss=env.get("FAKE_MODEL_ON_MISS", "synthesize"),
+            seed=int(seed) if seed else None,
+            replay_latency=env.get("FAKE_MODEL_REPLAY_LATENCY", "false").lower() in ("1", "true", "yes", "on")
+        )
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _draw(self):
+        # Shared generator, so a seeded run is reproducible call for call
+        with self._lock:
+            latency = self._random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma) \
+                if self.latency_ms > 0 else 0.0
+            return latency, self._random.random(), self._random.random()
+
+    def generate_content(self, model_name, contents, **kwargs):
+        """Answer like model.generate_content, after a simulated delay"""
+        self._count("calls")
+        latency, fault, malformed = self._draw()
+        key = content_key(contents, model_name)
+        entry = self.cassette.get(key, legacy_key=content_key(contents)) if self.cassette is not None else None
+        if entry is not None and self.replay_latency and "latency" in entry:
+            latency = entry["latency"]
+        time.sleep(latency)
+
+        if fault < self.error_rate:
+            self._count("errors")
+            raise google_exceptions.ServiceUnavailable(f"Fake backend error for {model_name}")
+        if fault < self.error_rate + self.throttle_rate:
+            self._count("throttled")
+            raise google_exceptions.ResourceExhausted(f"Fake backend quota exceeded for {model_name}")
+
+        if entry is not None:
+            self._count("replayed")
+            text = entry["text"]
+        elif self.on_miss == "error":
+            self._count("errors")
+            raise google_exceptions.NotFound(f"No recorded response for {key[:12]}")
+        else:
+            self._count("synthesized")
+            text = json.dumps(synthesize(contents, random.Random(f"{self.seed}:{key}")))
+
+        if malformed < self.malformed_rate:
+            self._count("malformed")
+            # Alternate between a truncated reply and one wrapped in prose
+            text = text[:len(text) // 2] if malformed < self.malformed_rate / 2 \
+                else f"Here is the analysis you asked for:\n```json\n{text}\n```\nLet me know if you need more."
+
+        recorded = entry.get("usage") if entry is not None else None
+        if recorded:
+            # Replays cost what the recorded call did
+            return FakeResponse(text, FakeUsage(recorded.get("prompt_token_count", 0),
+                                                recorded.get("candidates_token_count", 0)))
+        prompt_tokens = estimate_tokens(_prompt_text(contents)) + IMAGE_TOKENS * _image_count(contents)
+        return FakeResponse(text, FakeUsage(prompt_tokens, estimate_tokens(text)))
+
+    def stats(self):
+        with self._lock:
+            return [dict(self._counts, backend="fake", cassette_entries=len(self.cassette) if self.cassette else 0)]
+
+
+class RecordingBackend:
+    """Pass calls to another backend and append each successful response to a cassette"""
+
+    def __init__(self, inner, cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    def generate_content(self, model_name, contents, **kwargs):
+        start_time = time.time()
+        response = self.inner.generate_content(model_name, contents, **kwargs)
+        try:
+            usage = getattr(response, "usage_metadata", None)
+            self.cassette.append({
+                "key": content_key(contents, model_name),
+                "key_version": Cassette.KEY_VERSION,
+                "model": normalize_model_name(model_name),
+                "prompt": _prompt_text(contents)[:200],
+                "images": _image_count(contents),
+                "text": response.text,
+                "latency": round(time.time() - start_time, 4),
+                "usage": {
+                    "prompt_token_count": getattr(usage, "prompt_token_count", 0) or 0,
+                    "candidates_token_count": getattr(usage, "candidates_token_count", 0) or 0
+                },
+                "recorded_at": time.time()
+            })
+        except (OSError, ValueError) as e:
+            # Blocked responses have no text; recording must never fail the call
+            logger.warning(f"Could not record model response: {e}")
+        return response
+
+    def stats(self):
+        return self.inner.stats()
+
+
+def create_backend(env):
+    """
+    Build the model backend selected by MODEL_BACKEND
+
+    Returns:
+        The backend (GeminiClientPool, FakeModelBackend or RecordingBackend)
+    """
+    name = env.get("MODEL_BACKEND", "gemini")
+    if name not in BACKENDS:
+        raise ValueError(f"MODEL_BACKEND must be one of {BACKENDS}")
+    if name == "fake":
+        return FakeModelBackend.from_env(env)
+
+    pool = GeminiClientPool.from_env(env)
+    if name == "record":
+        return RecordingBackend(pool, Cassette(env.get("MODEL_CASSETTE", "cassette.jsonl")))
+    return pool
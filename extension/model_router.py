@@ -0,0 +1,112 @@
+# model_router.py
+import logging
+import re
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+CHEAP_ROUTE = "flash"
+STRONG_ROUTE = "pro"
+
+# Phrases that usually mean a listing covers more than one product
+MULTI_PRODUCT_PATTERNS = [
+    r"\bset of \d+", r"\bpack of \d+", r"\bbundle\b", r"\bkit includes\b",
+    r"\bcombo\b", r"\bvariety pack\b", r"\bassorted\b"
+]
+
+# Eco claims and problem materials; a description mixing both needs careful judgement
+CLAIM_TERMS = ["eco-friendly", "eco friendly", "green", "natural", "sustainable", "earth-friendly", "non-toxic", "clean"]
+CONCERN_TERMS = ["plastic", "polyester", "synthetic", "pvc", "single-use", "disposable", "petroleum"]
+
+
+class ModelRouter:
+    """
+    Decide whether a text request can be served by the cheap model tier
+    or needs the strong one, and collect per-route metrics for tuning.
+    """
+
+    def __init__(self, long_input_words=120, max_list_items=1):
+        self.long_input_words = long_input_words
+        self.max_list_items = max_list_items
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def route(self, text):
+        """
+        Choose a route for the given input
+
+        Args:
+            text (str): The product description being analyzed
+
+        Returns:
+            tuple: (route name, reason string)
+        """
+        text_lower = text.lower()
+
+        word_count = len(text.split())
+        if word_count > self.long_input_words:
+            return STRONG_ROUTE, "long_input"
+
+        # Several bulleted or numbered lines usually describe several products
+        list_items = len(re.findall(r"^\s*(?:[-*•]|\d+[.)])\s+", text, re.MULTILINE))
+        if list_items > self.max_list_items:
+            return STRONG_ROUTE, "multi_product"
+        if any(re.search(pattern, text_lower) for pattern in MULTI_PRODUCT_PATTERNS):
+            return STRONG_ROUTE, "multi_product"
+
+        has_claims = any(term in text_lower for term in CLAIM_TERMS)
+        has_concerns = any(term in text_lower for term in CONCERN_TERMS)
+        if has_claims and has_concerns:
+            return STRONG_ROUTE, "ambiguous_claims"
+
+        return CHEAP_ROUTE, "simple_input"
+
+    def record(self, route, method, latency, usage=None, ok=True, escalated=False):
+        """
+        Record the outcome of one model call on a route
+
+        Args:
+            route (str): The route the call was made on
+            method (str): The analyzer method that made the call
+            latency (float): Wall-clock seconds spent in the call
+            usage: The response usage metadata, if any
+            ok (bool): Whether the reply passed validation
+            escalated (bool): Whether this call was an escalation from the cheap route
+        """
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+
+        with self._lock:
+            metrics = self._metrics.setdefault((route, method), {
+                "calls": 0,
+                "failures": 0,
+                "escalations": 0,
+                "latency_total": 0.0,
+                "latency_max": 0.0,
+                "prompt_tokens": 0,
+                "output_tokens": 0
+            })
+            metrics["calls"] += 1
+            metrics["failures"] += 0 if ok else 1
+            metrics["escalations"] += 1 if escalated else 0
+            metrics["latency_total"] += latency
+            metrics["latency_max"] = max(metrics["latency_max"], latency)
+            metrics["prompt_tokens"] += prompt_tokens
+            metrics["output_tokens"] += output_tokens
+
+    def stats(self):
+        """Return per-route, per-method metrics with averages filled in"""
+        with self._lock:
+            result = []
+            for (route, method), metrics in sorted(self._metrics.items()):
+                calls = metrics["calls"]
+                result.append({
+                    "route": route,
+                    "method": method,
+                    **metrics,
+                    "latency_avg": round(metrics["latency_total"] / calls, 4) if calls else 0.0,
+                    "failure_rate": round(metrics["failures"] / calls, 4) if calls else 0.0
+                })
+            return result
@@ -0,0 +1,260 @@
+# profiling.py
+"""
+On-demand profiling of a live worker.
+
+One session runs at a time per process and covers the next N requests or
+T seconds, whichever comes first:
+
+- "cprofile": deterministic profile of the requests, as pstats text or a
+  raw pstats dump (for snakeviz / gprof2dot). Pool tasks a profiled
+  request queues through tracing.in_context are profiled into the same
+  session; other threads (job workers, background indexers) are not, so
+  use "sample" to see them
+- "sample": a thread samples every thread's stack at a fixed interval and
+  returns collapsed stacks, ready for flamegraph.pl or speedscope
+- "tracemalloc": allocation snapshot diff over the window, to find memory
+  growth in the analyzer and engine
+"""
+import cProfile
+import contextvars
+import io
+import linecache
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample", "tracemalloc")
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The session profiling the current request, seen by the pool tasks it queues via tracing.in_context
+_request_session = contextvars.ContextVar("profile_session", default=None)
+
+# Stacks whose innermost frame is in one of these modules are threads waiting for work
+IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", "socketserver.py", "socket.py", "ssl.py")
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profiling session is already running in this process"""
+
+
+class ProfileSession:
+    def __init__(self, mode, requests, seconds, interval=0.005, include_idle=False, app_only=True, top=50):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.mode = mode
+        self.requests = requests
+        self.seconds = seconds
+        self.interval = interval
+        self.include_idle = include_idle
+        self.app_only = app_only
+        self.top = top
+
+        self.started_at = time.time()
+        self.finished_at = None
+        self.requests_seen = 0
+        self.done = threading.Event()
+
+        self._lock = threading.Lock()
+        # cProfile can only profile one request at a time (and from Python 3.12 one
+        # profiler per process), so concurrent requests are skipped rather than mixed
+        self._active = threading.Lock()
+        self._stats = None
+        self._samples = {}
+        self._snapshot = None
+        self._started_tracing = False
+        self._result = None
+
+    def summary(self):
+        return {
+            "pid": os.getpid(),
+            "mode": self.mode,
+            "requests_seen": self.requests_seen,
+            "seconds": round((self.finished_at or time.time()) - self.started_at, 3),
+            "finished": self.done.is_set()
+        }
+
+
+class Profiler:
+    """Per-process profiling controller, driven by the app's request hooks"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.session = None
+
+    def start(self, session):
+        """Begin a session; raises ProfilerBusyError if one is running"""
+        with self._lock:
+            if self.session is not None and not self.session.done.is_set():
+                raise ProfilerBusyError("A profiling session is already running in this worker")
+            self.session = session
+
+        if session.mode == "sample":
+            threading.Thread(target=self._sample_loop, args=(session,), name="profile-sampler", daemon=True).start()
+        elif session.mode == "tracemalloc":
+            session._started_tracing = not tracemalloc.is_tracing()
+            if session._started_tracing:
+                tracemalloc.start(25)
+            session._snapshot = tracemalloc.take_snapshot()
+
+        # Close the window at the deadline even if too few requests arrive
+        timer = threading.Timer(session.seconds, self._finish, args=(session,))
+        timer.daemon = True
+        timer.start()
+        logger.info(f"Profiling started: {session.summary()}")
+        return session
+
+    def request_started(self):
+        """Call at the start of a request; returns a token for request_finished"""
+        session = self.session
+        if session is None or session.done.is_set() or session.mode != "cprofile":
+            return None
+        if not session._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active in this process
+            session._active.release()
+            return None
+        _request_session.set(session)
+        return (session, profile)
+
+    def request_finished(self, token=None):
+        """Call when a request ends, with the token request_started returned"""
+        if token is not None:
+            session, profile = token
+            profile.disable()
+            _request_session.set(None)
+            session._active.release()
+            self._add_profile(session, profile)
+
+        session = self.session
+        if session is None or session.done.is_set():
+            return
+        if token is not None or session.mode != "cprofile":
+            with session._lock:
+                session.requests_seen += 1
+                reached = session.requests_seen >= session.requests
+            if reached:
+                self._finish(session)
+
+    def run_task(self, func, *args, **kwargs):
+        """
+        Run a pool task, profiling it into the session of the request that queued it
+
+        Called by tracing.in_context inside the request's copied context.
+        cProfile only sees the thread it was enabled on, so each task gets
+        its own profiler. From Python 3.12 a profiler covers every thread
+        and only one can be enabled, which the request's already is.
+        """
+        session = _request_session.get()
+        if session is None:
+            return func(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._add_profile(session, profile)
+
+    def _add_profile(self, session, profile):
+        with session._lock:
+            if session._stats is None:
+                session._stats = pstats.Stats(profile)
+            else:
+                session._stats.add(profile)
+
+    def _finish(self, session):
+        with session._lock:
+            if session.done.is_set():
+                return
+            session.finished_at = time.time()
+            if session.mode == "tracemalloc":
+                session._result = self._memory_diff(session)
+            session.done.set()
+        logger.info(f"Profiling finished: {session.summary()}")
+
+    def _sample_loop(self, session):
+        own_id = threading.get_ident()
+        while not session.done.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if not session.include_idle and os.path.basename(frame.f_code.co_filename) in IDLE_MODULES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                session._samples[key] = session._samples.get(key, 0) + 1
+            time.sleep(session.interval)
+
+    def _memory_diff(self, session):
+        snapshot = tracemalloc.take_snapshot()
+        if session._started_tracing:
+            tracemalloc.stop()
+
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        if session.app_only:
+            filters.append(tracemalloc.Filter(True, os.path.join(APP_DIR, "*")))
+        diff = snapshot.filter_traces(filters).compare_to(session._snapshot.filter_traces(filters), "lineno")
+
+        growth = []
+        for stat in diff[:session.top]:
+            frame = stat.traceback[0]
+            growth.append({
+                "file": os.path.relpath(frame.filename, APP_DIR) if frame.filename.startswith(APP_DIR) else frame.filename,
+                "line": frame.lineno,
+                "code": linecache.getline(frame.filename, frame.lineno).strip(),
+                "size_diff": stat.size_diff,
+                "count_diff": stat.count_diff,
+                "size": stat.size
+            })
+        return {
+            "total_size_diff": sum(stat.size_diff for stat in diff),
+            "top": growth
+        }
+
+    def result(self, session, output_format="text"):
+        """
+        Render a finished session
+
+        Returns:
+            tuple: (body, mimetype)
+        """
+        if session.mode == "sample":
+            lines = [f"{stack} {count}" for stack, count in sorted(session._samples.items())]
+            return "\n".join(lines) + "\n", "text/plain"
+
+        if session.mode == "tracemalloc":
+            return dict(session.summary(), **session._result), "application/json"
+
+        if session._stats is None:
+            return "No requests were profiled\n", "text/plain"
+        if output_format == "raw":
+            # The same format cProfile.dump_stats writes, for snakeviz / gprof2dot / pstats.Stats
+            return marshal.dumps(session._stats.stats), "application/octet-stream"
+
+        stream = io.StringIO()
+        with session._lock:
+            session._stats.stream = stream
+            session._stats.sort_stats("cumulative").print_stats(session.top)
+        return stream.getvalue(), "text/plain"
+
+
+profiler = Profiler()
@@ -0,0 +1,435 @@
+# prompts.py
+"""
+Versioned prompt templates for SustainabilityAnalyzer.
+
+Templates use $placeholders (string.Template) so JSON examples need no
+escaping. Rendered prompts are whitespace-compacted and user input is held
+to a token budget. The builder keeps before/after token counts per
+template, where "before" is the original v1 prompt with the untrimmed input.
+
+Print the measurements for a sample (or given) description:
+
+    python prompts.py [description.txt]
+"""
+import json
+import logging
+import math
+import os
+import re
+import sys
+import textwrap
+import threading
+from string import Template
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# Shared by every prompt that rates greenwashing risk
+GREENWASHING_GUIDELINES = """
+Greenwashing risk guidelines (be skeptical; demand evidence for claims):
+- High: several vague eco-claims (eco-friendly, green, natural) without specifics or verification
+- Medium: some unsubstantiated or misleading claims alongside some valid information
+- Low: few or no eco-claims, or well-substantiated ones
+- Vague "eco-friendly"/"green"/"natural" claims are never Low; eco-labelled plastic is Medium or High
+- Environmental claims without certifications are at least Medium
+"""
+
+JSON_ONLY = "Reply with the JSON object only: no markdown, code fences or other text."
+
+TEMPLATES = {
+    "description_analysis": {
+        "v1": """
+            Analyze this product description for sustainability and environmental impact:
+
+            PRODUCT DESCRIPTION:
+            $description
+
+            Perform a comprehensive sustainability analysis and return a STRUCTURED JSON RESPONSE with the following fields:
+
+            1. materials_sustainability (float, 1-10): Score for the sustainability of materials
+            2. manufacturing_process (float, 1-10): Score for the manufacturing process sustainability
+            3. carbon_footprint (float, 1-10): Score for the product's carbon footprint (lower is better)
+            4. recyclability (float, 1-10): Score for how recyclable the product is
+            5. overall_sustainability_score (float, 1-10): Overall sustainability score
+            6. improvement_opportunities (array of strings): List specific ways this product could be more sustainable
+            7. sustainability_tags (object): Boolean fields for tags like "Eco-Friendly", "Organic", "Recyclable", "Biodegradable", "Fair Trade", "Energy Efficient", "Plastic-Free", "Single-Use", "Plastic Packaging", "High Carbon Footprint"
+            8. sustainability_justification (string): Brief paragraph explaining the sustainability assessment
+
+            Format your response as a well-structured JSON object WITHOUT ANY ADDITIONAL TEXT. Do not include markdown formatting, code blocks, or any text outside the JSON structure.
+            """,
+        "v2": """
+            Rate the sustainability of this product.
+
+            PRODUCT DESCRIPTION:
+            $description
+
+            Return JSON with:
+            materials_sustainability, manufacturing_process, carbon_footprint (lower is better), recyclability, overall_sustainability_score: floats 1-10
+            improvement_opportunities: array of specific improvements
+            sustainability_tags: object of booleans for "Eco-Friendly", "Organic", "Recyclable", "Biodegradable", "Fair Trade", "Energy Efficient", "Plastic-Free", "Single-Use", "Plastic Packaging", "High Carbon Footprint"
+            sustainability_justification: short paragraph
+            $json_only
+            """
+    },
+    "greenwashing": {
+        "v1": """
+            Analyze this product description for potential greenwashing:
+
+            PRODUCT DESCRIPTION:
+            $description
+
+            Greenwashing is the practice of making misleading or unsubstantiated claims about the environmental benefits of a product.
+
+            IMPORTANT ASSESSMENT GUIDELINES:
+            - "High" greenwashing risk: Products with multiple vague eco-claims (eco-friendly, green, natural) without specific details or verification
+            - "Medium" greenwashing risk: Products with some unsubstantiated claims or misleading terminology, but also some valid information
+            - "Low" greenwashing risk: Products with few or no eco-claims, or products with well-substantiated environmental claims
+            - Products using "eco-friendly," "green," or "natural" without specific details should NOT be rated "Low" risk
+            - Products with plastic components labeled as "eco-friendly" should be "Medium" or "High" risk
+            - Products making environmental claims without third-party certifications should be at least "Medium" risk
+
+            Be critical and skeptical in your assessment. The default for products making environmental claims should be "Medium" risk unless they provide specific, verifiable evidence.
+
+            Return a detailed analysis in JSON format with these fields:
+
+            1. greenwashing_risk (string): "Low", "Medium", or "High" risk of greenwashing - be sure to follow the guidelines above
+            2. issues (array of strings): Specific potential greenwashing issues identified, if any
+            3. vague_claims (array of strings): Any vague or unsubstantiated environmental claims
+            4. misleading_terms (array of strings): Any potentially misleading terms
+            5. missing_information (array of strings): Critical sustainability information that's missing
+            6. explanation (string): Detailed explanation of the greenwashing assessment
+            7. recommendations (array of strings): How the product description could be improved for transparency
+
+            Format your response as a well-structured JSON object WITHOUT ANY ADDITIONAL TEXT.
+            """,
+        "v2": """
+            Assess this product description for greenwashing (misleading or unsubstantiated environmental claims).
+
+            PRODUCT DESCRIPTION:
+            $description
+            $guidelines
+            Claims without specific, verifiable evidence default to Medium.
+
+            Return JSON with:
+            greenwashing_risk: "Low", "Medium" or "High"
+            issues, vague_claims, misleading_terms, missing_information, recommendations: arrays of strings
+            explanation: string
+            $json_only
+            """
+    },
+    "image_analysis": {
+        "v1": """
+            Analyze this product image and provide:
+
+            1. What the product appears to be
+            2. A detailed description of what you observe
+            3. Any visible materials, packaging, or labeling
+            4. Any sustainability or eco-friendly claims visible
+
+            Then analyze the product's likely sustainability impact based on what's visible.
+
+            IMPORTANT GREENWASHING ASSESSMENT GUIDELINES:
+            - "High" greenwashing risk: Products with multiple vague eco-claims (eco-friendly, green, natural) without specific details or verification
+            - "Medium" greenwashing risk: Products with some unsubstantiated claims or misleading terminology, but also some valid information
+            - "Low" greenwashing risk: Products with few or no eco-claims, or products with well-substantiated environmental claims
+            - Products using "eco-friendly," "green," or "natural" without specific details should NOT be rated "Low" risk
+            - Plastic products labeled as "eco-friendly" should be "Medium" or "High" risk
+            - Products making environmental claims without visible certifications should be at least "Medium" risk
+
+            Be skeptical and critical in your assessment. Apply a higher standard of evidence for sustainability claims.
+
+            Return the results as a STRUCTURED JSON with the following fields:
+
+            1. image_analysis: {
+               product_name: what the product appears to be,
+               description: detailed description of the product,
+               visible_materials: list of materials you can identify,
+               visible_claims: any eco-friendly or sustainability claims visible
+            }
+
+            2. sustainability_analysis: {
+               materials_sustainability (float, 1-10): Estimated score for sustainability of visible materials,
+               packaging_sustainability (float, 1-10): Score for visible packaging sustainability,
+               greenwashing_risk (string): "Low", "Medium", or "High" risk of greenwashing based on visible claims - be sure to follow the guidelines above,
+               improvement_suggestions: array of realistic sustainability improvements,
+               overall_sustainability_score (float, 1-10): Overall sustainability estimate,
+               sustainability_justification: Brief justification for the assessment
+            }
+
+            Format your response as a well-structured JSON object WITHOUT ANY ADDITIONAL TEXT.
+            """,
+        "v2": """
+            Identify the product in this image and rate its likely sustainability from what is visible.
+            $guidelines
+            Return JSON:
+            {"image_analysis": {"product_name": str, "description": str, "visible_materials": [str], "visible_claims": [str]},
+            "sustainability_analysis": {"materials_sustainability": 1-10, "packaging_sustainability": 1-10, "greenwashing_risk": "Low"|"Medium"|"High", "improvement_suggestions": [str], "overall_sustainability_score": 1-10, "sustainability_justification": str}}
+            $json_only
+            """
+    },
+    "multi_image_analysis": {
+        "v1": """
+            Analyze this image for multiple products and perform a sustainability analysis:
+
+            First, identify all distinct products visible in the image. For each identified product, provide:
+
+            1. What the product appears to be (name)
+            2. A detailed description of what you observe
+            3. Any visible materials, packaging, or labeling
+            4. Any sustainability or eco-friendly claims visible
+
+            Then analyze each product's likely sustainability impact based on what's visible.
+
+            IMPORTANT GREENWASHING ASSESSMENT GUIDELINES:
+            - "High" greenwashing risk: Products with multiple vague eco-claims (eco-friendly, green, natural) without specific details or verification
+            - "Medium" greenwashing risk: Products with some unsubstantiated claims or misleading terminology, but also some valid information
+            - "Low" greenwashing risk: Products with few or no eco-claims, or products with well-substantiated environmental claims
+            - Products using "eco-friendly," "green," or "natural" without specific details should NOT be rated "Low" risk
+            - Plastic products labeled as "eco-friendly" should be "Medium" or "High" risk
+            - Products making environmental claims without visible certifications should be at least "Medium" risk
+
+            Be skeptical and critical in your assessment. Apply a higher standard of evidence for sustainability claims.
+
+            Return the results as a STRUCTURED JSON with the following format:
+
+            {
+                "multiple_products": true,
+                "product_count": number of distinct products identified,
+                "products": [
+                    {
+                        "image_analysis": {
+                            "product_name": what this product appears to be,
+                            "description": detailed description of this product,
+                            "visible_materials": list of materials you can identify for this product,
+                            "visible_claims": any eco-friendly or sustainability claims visible for this product
+                        },
+                        "sustainability_analysis": {
+                            "materials_sustainability": estimated score (1-10) for sustainability of visible materials,
+                            "packaging_sustainability": score (1-10) for visible packaging sustainability,
+                            "greenwashing_risk": "Low", "Medium", or "High" risk of greenwashing based on visible claims - be sure to follow the guidelines above,
+                            "improvement_suggestions": array of realistic sustainability improvements,
+                            "overall_sustainability_score": overall sustainability estimate (1-10),
+                            "sustainability_justification": brief justification for the assessment
+                        }
+                    },
+                    ... (repeat for each identified product)
+                ]
+            }
+
+            If only one product is clearly visible, still use the same format but with product_count: 1.
+            Format your response as a well-structured JSON object WITHOUT ANY ADDITIONAL TEXT.
+            """,
+        "v2": """
+            Identify every distinct product in this image and rate each one's likely sustainability from what is visible.
+            $guidelines
+            Return JSON (product_count 1 if only one product is visible):
+            {"multiple_products": true, "product_count": int, "products": [
+            {"image_analysis": {"product_name": str, "description": str, "visible_materials": [str], "visible_claims": [str]},
+            "sustainability_analysis": {"materials_sustainability": 1-10, "packaging_sustainability": 1-10, "greenwashing_risk": "Low"|"Medium"|"High", "improvement_suggestions": [str], "overall_sustainability_score": 1-10, "sustainability_justification": str}}]}
+            $json_only
+            """
+    },
+    "product_detection": {
+        "v1": """
+            Identify every distinct product visible in this image.
+
+            Return a STRUCTURED JSON object with the following format:
+
+            {
+                "products": [
+                    {
+                        "product_name": short name of the product,
+                        "box_2d": [ymin, xmin, ymax, xmax] bounding box normalized to 0-1000
+                    }
+                ]
+            }
+
+            Format your response as a well-structured JSON object WITHOUT ANY ADDITIONAL TEXT.
+            """,
+        "v2": """
+            Identify every distinct product visible in this image.
+            Return JSON: {"products": [{"product_name": short name, "box_2d": [ymin, xmin, ymax, xmax] normalized to 0-1000}]}
+            $json_only
+            """
+    }
+}
+
+# Lines that scraped product pages carry but that say nothing about the product. Each pattern
+# must match a whole line (bar punctuation and bullets), so product copy that merely mentions
+# "cookies", "sign", "quantity" or "in stock" is kept
+BOILERPLATE_PATTERNS = [
+    r"add to (cart|bag|basket|wish ?list)", r"buy (it )?now", r"free (shipping|delivery|returns)\b.*",
+    r"(30|60|90)[- ]day (free )?returns?\b.*", r"((we|this (site|website)) uses? |accept (all )?)?cookies\b.*",
+    r"privacy policy", r"terms (of|&|and) (use|service)", r"sign (in|up|out)\b.*", r"log ?(in|out)\b.*",
+    r"subscribe\b.*", r"(sign up for |join )?(our )?newsletter\b.*", r"customers (also|who) (bought|viewed)\b.*",
+    r"[\d.]+ out of 5 stars\b.*", r"[\d,]+ (ratings|reviews)", r"write a review", r"share (this|on)\b.*",
+    r"home|shop|menu|search|cart|account", r"(©|copyright\b).*", r"all rights reserved",
+    r"(only \d+ left )?(in|out of) stock(\W+(order|ships?|ready)\b.*)?", r"(qty|quantity)\b:? ?\d*",
+    r"(sku|item|model)( ?(no|number|#))?:.*"
+]
+BOILERPLATE_RE = re.compile(
+    r"\W*(?:" + "|".join(f"(?:{pattern})" for pattern in BOILERPLATE_PATTERNS) + r")\W*", re.IGNORECASE
+)
+URL_RE = re.compile(r"https?://\S+")
+TRUNCATION_MARKER = "\n[...]\n"
+
+
+def estimate_tokens(text):
+    """
+    Estimate the token count of a text without calling the model API
+
+    Roughly four characters per token for English prose, which is what
+    Gemini's tokenizer averages on product copy.
+    """
+    return math.ceil(len(text) / 4) if text else 0
+
+
+def compact(text):
+    """Dedent, strip trailing/leading space on every line and collapse blank lines"""
+    lines = [line.strip() for line in textwrap.dedent(text).strip().splitlines()]
+    return re.sub(r"\n{2,}", "\n\n", "\n".join(lines))
+
+
+def strip_boilerplate(text):
+    """Drop URLs, store chrome (cart, shipping, reviews, legal) and repeated lines from scraped copy"""
+    seen = set()
+    kept = []
+    for line in URL_RE.sub("", text).splitlines():
+        line = line.strip()
+        key = line.lower()
+        if not line or key in seen or (len(line) < 120 and BOILERPLATE_RE.fullmatch(line)):
+            continue
+        seen.add(key)
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def fit_to_budget(text, max_tokens):
+    """
+    Hold user input to a token budget
+
+    Oversized input first loses boilerplate; if it is still too long the
+    middle is cut, keeping the opening (what the product is) and the end
+    (where materials and certifications are usually listed).
+
+    Returns:
+        tuple: (text, True if the text was changed)
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+
+    text = strip_boilerplate(text)
+    if estimate_tokens(text) <= max_tokens:
+        return text, True
+
+    budget_chars = max(0, max_tokens * 4 - len(TRUNCATION_MARKER))
+    head_chars = budget_chars * 3 // 4
+    tail_chars = budget_chars - head_chars
+    head = text[:head_chars].rsplit(" ", 1)[0]
+    tail = text[len(text) - tail_chars:].split(" ", 1)[-1] if tail_chars else ""
+    return head + TRUNCATION_MARKER + tail, True
+
+
+class PromptBuilder:
+    """
+    Renders versioned templates and records token measurements per template
+    """
+
+    def __init__(self, versions=None, default_version="v2", input_budget=1500):
+        self.versions = versions or {}
+        self.default_version = default_version
+        self.input_budget = input_budget
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ):
+        """Build from PROMPT_VERSION, PROMPT_VERSIONS ('{"greenwashing": "v1"}') and PROMPT_INPUT_TOKEN_BUDGET"""
+        return cls(
+            versions=json.loads(environ.get("PROMPT_VERSIONS", "{}")),
+            default_version=environ.get("PROMPT_VERSION", "v2"),
+            input_budget=int(environ.get("PROMPT_INPUT_TOKEN_BUDGET", "1500"))
+        )
+
+    def version(self, name):
+        version = self.versions.get(name, self.default_version)
+        return version if version in TEMPLATES[name] else "v1"
+
+    def build(self, name, **fields):
+        """
+        Render a template with budgeted, compacted input
+
+        Args:
+            name (str): Template name, e.g. "description_analysis"
+            **fields: Values for the template's placeholders
+
+        Returns:
+            str: The prompt to send
+        """
+        version = self.version(name)
+        truncated = False
+        budgeted = {}
+        for field, value in fields.items():
+            budgeted[field], changed = fit_to_budget(str(value), self.input_budget)
+            truncated = truncated or changed
+
+        prompt = self._render(TEMPLATES[name][version], budgeted)
+        if version != "v1":
+            prompt = compact(prompt)
+
+        before = estimate_tokens(self._render(TEMPLATES[name]["v1"], fields))
+        after = estimate_tokens(prompt)
+        with self._lock:
+            stats = self._stats.setdefault((name, version), {
+                "renders": 0, "truncated": 0, "tokens_before": 0, "tokens_after": 0
+            })
+            stats["renders"] += 1
+            stats["truncated"] += 1 if truncated else 0
+            stats["tokens_before"] += before
+            stats["tokens_after"] += after
+        return prompt
+
+    @staticmethod
+    def _render(template, fields):
+        return Template(template).safe_substitute(
+            guidelines=GREENWASHING_GUIDELINES, json_only=JSON_ONLY, **fields
+        )
+
+    def stats(self):
+        """Return before/after token totals and averages per template and version"""
+        with self._lock:
+            result = []
+            for (name, version), stats in sorted(self._stats.items()):
+                renders = stats["renders"]
+                result.append(dict(
+                    stats,
+                    template=name,
+                    version=version,
+                    avg_tokens_before=round(stats["tokens_before"] / renders, 1),
+                    avg_tokens_after=round(stats["tokens_after"] / renders, 1),
+                    saved_pct=round(100 * (1 - stats["tokens_after"] / stats["tokens_before"]), 1)
+                    if stats["tokens_before"] else 0.0
+                ))
+            return result
+
+
+SAMPLE_DESCRIPTION = (
+    "Organic cotton t-shirt made with renewable energy in a fair-trade certified facility. "
+    "Made with 100% GOTS certified organic cotton. Low-impact dyes. Carbon-neutral shipping."
+)
+
+if __name__ == "__main__":
+    description = SAMPLE_DESCRIPTION
+    if len(sys.argv) > 1:
+        with open(sys.argv[1]) as f:
+            description = f.read()
+
+    builder = PromptBuilder.from_env(os.environ)
+    for name in TEMPLATES:
+        builder.build(name, description=description)
+
+    print(f"{'template':<24}{'version':<9}{'before':>8}{'after':>8}{'saved':>8}")
+    for row in builder.stats():
+        print(f"{row['template']:<24}{row['version']:<9}{row['tokens_before']:>8}"
+              f"{row['tokens_after']:>8}{row['saved_pct']:>7}%")
@@ -0,0 +1,210 @@
+# rate_limit.py
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_util import Transaction
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: refills at `rate` tokens per second up to `capacity`
+
+    A take larger than the capacity goes through once the bucket is full and
+    leaves it in debt, so it is charged in full and later takes wait for the
+    difference to refill.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens=1):
+        """
+        Take tokens if available without waiting
+
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they would be available
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            needed = min(tokens, self.capacity)
+            if self.tokens >= needed:
+                self.tokens -= tokens
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until the tokens are available, then take them"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+class MemoryBucketStore:
+    """
+    Per-key token buckets in process memory
+
+    The least recently used buckets are dropped past max_keys; a dropped
+    bucket simply starts full again, which only ever errs towards allowing.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, tokens=1):
+        """
+        Take tokens from the bucket for key if available
+
+        Returns:
+            tuple: (seconds to wait, 0 if the tokens were taken; tokens left, negative while in debt)
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(rate, capacity)
+                while len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+        wait = bucket.try_acquire(tokens)
+        return wait, bucket.tokens
+
+
+class SqliteBucketStore:
+    """
+    Per-key token buckets in a SQLite file shared by every worker process
+
+    Each take is one short IMMEDIATE transaction (read, refill, write), so
+    limits hold across gunicorn workers on the same host. Buckets that
+    would be full again anyway are pruned now and then.
+    """
+
+    def __init__(self, db_path, prune_every=1000):
+        self.db_path = db_path
+        self.prune_every = prune_every
+        self._takes = 0
+        self._takes_lock = threading.Lock()
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    full_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return Transaction(conn)
+
+    def take(self, key, rate, capacity, tokens=1):
+        """Same contract as MemoryBucketStore.take"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tokens, updated_at FROM token_buckets WHERE key = ?", (key,)).fetchone()
+            available = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+            # Same rule as TokenBucket: an oversized take waits for a full bucket and leaves it in debt
+            needed = min(tokens, capacity)
+            wait = 0.0
+            if available >= needed:
+                available -= tokens
+            else:
+                wait = (needed - available) / rate
+            conn.execute(
+                "INSERT INTO token_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, "
+                "full_at = excluded.full_at",
+                (key, available, now, now + (capacity - available) / rate)
+            )
+
+            with self._takes_lock:
+                self._takes += 1
+                prune = self._takes % self.prune_every == 0
+            if prune:
+                conn.execute("DELETE FROM token_buckets WHERE full_at < ?", (now,))
+        return wait, available
+
+
+class ClientRateLimiter:
+    """
+    Token-bucket quotas per client and route class.
+
+    Each class (e.g. "model" and "cheap") has its own rate (tokens per
+    second) and burst capacity, so a client that exhausts its model quota
+    can still browse. Buckets live in process memory unless a shared store
+    is given.
+    """
+
+    def __init__(self, limits, store=None):
+        self.limits = dict(limits)
+        self.store = store or MemoryBucketStore()
+
+    @classmethod
+    def from_env(cls, env):
+        """
+        Build a limiter from CLIENT_<CLASS>_RATE / CLIENT_<CLASS>_BURST settings
+
+        RATE_LIMIT_STORE=sqlite shares the buckets across worker processes
+        through RATE_LIMIT_DB_PATH. A rate of 0 leaves a class unlimited.
+        """
+        limits = {}
+        for name, rate, burst in (("model", "0.5", "10"), ("cheap", "5", "30")):
+            class_rate = float(env.get(f"CLIENT_{name.upper()}_RATE", rate))
+            if class_rate > 0:
+                limits[name] = (class_rate, float(env.get(f"CLIENT_{name.upper()}_BURST", burst)))
+
+        store = None
+        if env.get("RATE_LIMIT_STORE", "memory") == "sqlite":
+            store = SqliteBucketStore(env.get("RATE_LIMIT_DB_PATH", "ratelimit.db"))
+        return cls(limits, store)
+
+    def check(self, route_class, client, cost=1):
+        """
+        Charge a request to a client's bucket for the route class
+
+        Args:
+            route_class (str): The route class, e.g. "model"
+            client (str): A stable client identity (API key, session or IP)
+            cost (int): Tokens the request uses, charged in full; a cost above the burst
+                size passes once the bucket is full and leaves it in debt
+
+        Returns:
+            tuple: (seconds to wait, 0 if allowed; tokens left)
+        """
+        limit = self.limits.get(route_class)
+        if limit is None:
+            return 0.0, None
+        rate, capacity = limit
+        # Hash identities so API keys are never kept (or written to disk) in the clear
+        key = f"{route_class}:{hashlib.sha256(client.encode('utf-8')).hexdigest()[:32]}"
+        return self.store.take(key, rate, capacity, cost)
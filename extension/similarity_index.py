@@ -0,0 +1,268 @@
+# similarity_index.py
+import hashlib
+import json
+import logging
+import re
+import threading
+import zlib
+from array import array
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+
+# Words that carry no product information and only add noise to fingerprints
+STOPWORDS = frozenset([
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is",
+    "it", "its", "of", "on", "or", "our", "that", "the", "this", "to", "with", "your"
+])
+
+
+def content_words(text):
+    """Lowercased words of a text, without stopwords"""
+    return [w for w in re.findall(r"[a-z0-9]+", text.lower()) if w not in STOPWORDS]
+
+
+def simhash(text):
+    """
+    Compute a 64-bit SimHash fingerprint for a piece of text
+
+    Args:
+        text (str or list): The text to fingerprint, or its content_words
+
+    Returns:
+        int: The 64-bit fingerprint
+    """
+    words = content_words(text) if isinstance(text, str) else text
+
+    # Unigrams capture vocabulary, bigrams capture a little word order
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    if not features:
+        return 0
+
+    counts = [0] * FINGERPRINT_BITS
+    for feature in features:
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(FINGERPRINT_BITS):
+            if digest >> bit & 1:
+                counts[bit] += 1
+            else:
+                counts[bit] -= 1
+
+    fingerprint = 0
+    for bit, count in enumerate(counts):
+        if count > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    """Number of differing bits between two fingerprints"""
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHash:
+    """
+    Hamming-radius search over fixed-width hashes stored in numbered slots.
+
+    Hashes are split into `bands` bit ranges (max_distance + 1 by default).
+    By the pigeonhole principle two hashes within max_distance bits agree
+    exactly on at least one band, so a search only compares against slots
+    sharing a band with the query instead of scanning them all. Not
+    thread-safe; callers serialize access with their own lock.
+    """
+
+    def __init__(self, bits=FINGERPRINT_BITS, max_distance=3, bands=None):
+        if not 0 < bits <= 64:
+            raise ValueError("bits must be between 1 and 64")
+        if not 0 <= max_distance < bits // 2:
+            raise ValueError(f"max_distance must be between 0 and {bits // 2 - 1}")
+        bands = max_distance + 1 if bands is None else bands
+        if not max_distance < bands <= bits:
+            raise ValueError(f"bands must be between {max_distance + 1} and {bits}")
+
+        self.bits = bits
+        self.max_distance = max_distance
+
+        # Band layout: (shift, mask) pairs covering all the bits
+        width = bits // bands
+        self._bands = []
+        for i in range(bands):
+            shift = i * width
+            band_bits = width if i < bands - 1 else bits - shift
+            self._bands.append((shift, (1 << band_bits) - 1))
+
+        self._hashes = array("Q")
+        self._buckets = [dict() for _ in self._bands]
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _band_keys(self, value):
+        return [(value >> shift) & mask for shift, mask in self._bands]
+
+    def set(self, slot, value):
+        """Store a hash in a slot, replacing what it held; slots are filled in order"""
+        if slot < len(self._hashes):
+            for band, key in enumerate(self._band_keys(self._hashes[slot])):
+                bucket = self._buckets[band].get(key)
+                if bucket is not None:
+                    bucket.remove(slot)
+                    if not bucket:
+                        del self._buckets[band][key]
+            self._hashes[slot] = value
+        elif slot == len(self._hashes):
+            self._hashes.append(value)
+        else:
+            raise IndexError(f"slot {slot} is past the next free slot {len(self._hashes)}")
+
+        for band, key in enumerate(self._band_keys(value)):
+            self._buckets[band].setdefault(key, []).append(slot)
+
+    def nearest(self, value):
+        """
+        Find the stored hash closest to a value, within max_distance bits
+
+        Returns:
+            tuple: (slot, distance), or None if nothing is close enough
+        """
+        best_slot = None
+        best_distance = self.max_distance + 1
+        seen = set()
+
+        for band, key in enumerate(self._band_keys(value)):
+            for slot in self._buckets[band].get(key, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                distance = hamming_distance(value, self._hashes[slot])
+                if distance < best_distance:
+                    best_slot, best_distance = slot, distance
+                    if distance == 0:
+                        return slot, 0
+
+        return (best_slot, best_distance) if best_slot is not None else None
+
+
+class DescriptionSimilarityIndex:
+    """
+    Bounded near-duplicate index over analyzed product descriptions.
+
+    Fingerprints are searched with a MultiIndexHash, so a lookup only
+    compares against entries sharing a band with the query. Entries live in
+    a fixed-size ring buffer and payloads are stored as compressed JSON, so
+    memory stays bounded as the index wraps around.
+
+    Descriptions with fewer than min_tokens content words are neither
+    stored nor looked up: their fingerprints are built from too little text
+    (an empty one is 0), so unrelated short inputs would collide.
+    """
+
+    def __init__(self, capacity=100000, max_distance=3, min_tokens=3):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+
+        self._fingerprints = MultiIndexHash(FINGERPRINT_BITS, max_distance)
+        self._payloads = []
+        self._snippets = []
+        self._next_slot = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    def lookup(self, description):
+        """
+        Find the closest previously analyzed description within the threshold
+
+        Args:
+            description (str): The product description to look up
+
+        Returns:
+            dict: The cached analysis and match provenance, or None on a miss
+        """
+        words = content_words(description)
+        if len(words) < self.min_tokens:
+            with self._lock:
+                self.skipped += 1
+            return None
+        fingerprint = simhash(words)
+
+        with self._lock:
+            nearest = self._fingerprints.nearest(fingerprint)
+            if nearest is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            best_slot, best_distance = nearest
+            payload = self._payloads[best_slot]
+            snippet = self._snippets[best_slot]
+
+        return {
+            "analysis": json.loads(zlib.decompress(payload)),
+            "match": {
+                "type": "exact" if best_distance == 0 else "near_duplicate",
+                "distance": best_distance,
+                "similarity": round(1 - best_distance / FINGERPRINT_BITS, 4),
+                "threshold": self.max_distance,
+                "matched_description": snippet
+            }
+        }
+
+    def add(self, description, analysis):
+        """
+        Store an analysis for a description, evicting the oldest entry when full
+
+        Args:
+            description (str): The analyzed product description
+            analysis (dict): The analysis to reuse for near-duplicates
+
+        Returns:
+            bool: Whether the description was long enough to be stored
+        """
+        words = content_words(description)
+        if len(words) < self.min_tokens:
+            return False
+        fingerprint = simhash(words)
+        payload = zlib.compress(json.dumps(analysis).encode("utf-8"))
+        snippet = description[:80]
+
+        with self._lock:
+            slot = self._next_slot
+            # Reusing a slot evicts the entry occupying it
+            self._fingerprints.set(slot, fingerprint)
+            if slot < len(self._payloads):
+                self._payloads[slot] = payload
+                self._snippets[slot] = snippet
+            else:
+                self._payloads.append(payload)
+                self._snippets.append(snippet)
+
+            self._next_slot = (slot + 1) % self.capacity
+        return True
+
+    def stats(self):
+        """Return hit/miss counters and occupancy for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._fingerprints),
+                "capacity": self.capacity,
+                "max_distance": self.max_distance,
+                "min_tokens": self.min_tokens,
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
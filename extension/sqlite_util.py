@@ -0,0 +1,24 @@
+# sqlite_util.py
+
+
+class Transaction:
+    """
+    Context manager that commits or rolls back an explicit transaction if one is open
+
+    For connections opened with isolation_level=None (autocommit), where
+    statements run on their own unless the caller issues BEGIN.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.conn.in_transaction:
+            if exc_type is None:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        return False
@@ -15,6 +15,8 @@ $(document).ready(function() {
         }
 
         formData.append('image', imageFile);
+        formData.append('include_formatted', 'true');
+        formData.append('include_alternatives', 'true');
 
         // Create an image preview
         const previewUrl = URL.createObjectURL(imageFile);
@@ -0,0 +1,29 @@
+# test_stress_catalog.py
+"""
+Short run of benchmarks/stress_catalog.py: concurrent readers and writers
+on EcoRecommendationEngine must never see an inconsistent catalog.
+
+    python -m pytest tests
+"""
+import logging
+import os
+import sys
+
+EXTENSION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, EXTENSION_DIR)
+sys.path.insert(0, os.path.join(EXTENSION_DIR, "benchmarks"))
+
+import stress_catalog  # noqa: E402
+
+
+def test_concurrent_reads_and_writes_stay_consistent():
+    logging.disable(logging.CRITICAL)
+    try:
+        result = stress_catalog.run(readers=4, writers=3, products=300, batch_size=20, min_seconds=1.0, min_reads=200)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    assert result["failures"] == 0, result["failure_messages"]
+    assert result["products"] >= 3 * 300
+    # The run is only a stress test if readers overlapped the writers
+    assert result["reads_during_writes"] >= 200
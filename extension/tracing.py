@@ -0,0 +1,275 @@
+# tracing.py
+"""
+Lightweight request tracing.
+
+A trace is started per request; code marks its stages with `stage(...)`,
+which records a span under the current one (and the stage latency metric).
+The current span lives in a context variable, so use `in_context` to carry
+it into thread pool tasks. Finished traces give a Server-Timing header and
+a sample of them is appended to a JSONL file.
+
+Collapse an exported file into flamegraph input (stack;frames duration_us):
+
+    python tracing.py traces.jsonl > traces.folded
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from metrics import STAGE_LATENCY
+from profiling import profiler
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "traces.jsonl")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attrs", "start", "end")
+
+    def __init__(self, trace, name, parent_id=None, attrs=None):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self):
+        span = {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start - self.trace.root.start) * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3)
+        }
+        if self.attrs:
+            span["attrs"] = self.attrs
+        return span
+
+
+class Trace:
+    """All spans recorded while handling one request"""
+
+    def __init__(self, name, attrs=None, sampled=None):
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.sampled = random.random() < TRACE_SAMPLE_RATE if sampled is None else sampled
+        self.spans = []
+        self.root = Span(self, name, attrs=attrs)
+        self.spans.append(self.root)
+        self._token = _current_span.set(self.root)
+
+    def finish(self):
+        """Close the root span and detach the trace from the current context"""
+        self.root.end = time.perf_counter()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Finished from a different context than the one it was started in
+            _current_span.set(None)
+
+    def server_timing(self, limit=20):
+        """
+        Build a Server-Timing header value, summing spans that share a name
+
+        Returns:
+            str: e.g. 'total;dur=812.4, model_call;dur=640.2, json_parse;dur=1.3'
+        """
+        totals = {}
+        for span in self.spans[1:]:
+            if span.end is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        slowest = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+        metrics = [("total", self.root.duration)] + slowest
+        return ", ".join(f"{_token(name)};dur={duration * 1000:.1f}" for name, duration in metrics)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "timestamp": self.started_at,
+            "duration_ms": round(self.root.duration * 1000, 3),
+            "attrs": self.root.attrs,
+            "spans": [span.to_dict() for span in self.spans[1:] if span.end is not None]
+        }
+
+
+def _token(name):
+    # Server-Timing metric names must be HTTP tokens
+    return re.sub(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]", "_", name)
+
+
+def current_trace():
+    span = _current_span.get()
+    return span.trace if span else None
+
+
+def current_endpoint(default="background"):
+    """Name of the request being traced (e.g. 'POST /analyze'), or default outside a request"""
+    trace = current_trace()
+    return trace.root.name if trace else default
+
+
+class stage:
+    """
+    Mark a processing stage, as a context manager or a decorator
+
+    Records a span in the current trace (if any) and the stage latency metric.
+
+        with stage("image_preprocess", bytes=len(data)):
+            ...
+
+        @stage("scrape")
+        def _get_eco_friendly_products(self, ...):
+    """
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        parent = _current_span.get()
+        if parent is not None:
+            self._span = Span(parent.trace, self.name, parent.span_id, self.attrs)
+            self._span.start = self._start
+            self._token = _current_span.set(self._span)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        STAGE_LATENCY.observe(end - self._start, stage=self.name)
+        if self._span is not None:
+            self._span.end = end
+            if exc_type is not None:
+                self._span.attrs["error"] = exc_type.__name__
+            self._span.trace.spans.append(self._span)
+            _current_span.reset(self._token)
+        return False
+
+    def __call__(self, func):
+        name, attrs = self.name, self.attrs
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, **attrs):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def in_context(func):
+    """
+    Bind func to the caller's context so spans opened in a pool thread join the
+    current trace (and a cprofile session profiling the request covers the task)
+    """
+    context = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets its own copy
+        return context.copy().run(profiler.run_task, func, *args, **kwargs)
+    return run
+
+
+class _Exporter:
+    """Appends sampled traces to a JSONL file from a background thread"""
+
+    def __init__(self, path, max_pending=1000):
+        self.path = path
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        if not self.path:
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write_loop, name="trace-export", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait(trace.to_dict())
+        except queue.Full:
+            logger.debug("Trace export queue full, dropping trace")
+
+    def _write_loop(self):
+        while True:
+            record = self._queue.get()
+            try:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+                    # Drain whatever else is waiting while the file is open
+                    while True:
+                        try:
+                            f.write(json.dumps(self._queue.get_nowait()) + "\n")
+                        except queue.Empty:
+                            break
+            except OSError as e:
+                logger.error(f"Error exporting traces to {self.path}: {e}")
+
+
+exporter = _Exporter(TRACE_EXPORT_PATH)
+
+
+def _frame(name):
+    # Collapsed stacks separate frames with ';' and the count with a space
+    return re.sub(r"[;\s]+", "_", name)
+
+
+def collapse(records):
+    """
+    Turn exported traces into collapsed stacks for flamegraph tools
+
+    Yields:
+        str: 'root;child;grandchild <self time in microseconds>'
+    """
+    for record in records:
+        spans = {span["span_id"]: span for span in record["spans"]}
+        child_time = {}
+        for span in record["spans"]:
+            child_time[span["parent_id"]] = child_time.get(span["parent_id"], 0.0) + span["duration_ms"]
+
+        root_self = max(0.0, record["duration_ms"] - sum(
+            span["duration_ms"] for span in record["spans"] if span["parent_id"] not in spans
+        ))
+        yield f"{_frame(record['name'])} {int(root_self * 1000)}"
+
+        for span in record["spans"]:
+            stack = [_frame(span["name"])]
+            parent = spans.get(span["parent_id"])
+            while parent is not None:
+                stack.append(_frame(parent["name"]))
+                parent = spans.get(parent["parent_id"])
+            stack.append(_frame(record["name"]))
+            self_time = max(0.0, span["duration_ms"] - child_time.get(span["span_id"], 0.0))
+            yield f"{';'.join(reversed(stack))} {int(self_time * 1000)}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        sys.exit("usage: python tracing.py traces.jsonl")
+    with open(sys.argv[1]) as f:
+        for line in collapse(json.loads(line) for line in f if line.strip()):
+            print(line)
@@ -0,0 +1,245 @@
+# usage_ledger.py
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from sqlite_util import Transaction
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG)
+logger = logging.getLogger(__name__)
+
+# USD per million tokens (input, output); override with the MODEL_PRICES environment variable
+DEFAULT_PRICES = {
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-pro": (0.50, 1.50),
+    "gemini-pro-vision": (0.50, 1.50)
+}
+
+COUNTERS = ("calls", "errors", "cache_hits", "prompt_tokens", "output_tokens", "total_tokens", "latency_total")
+
+
+def normalize_model_name(model):
+    """Model name as priced and reported: the SDK's "models/gemini-1.5-pro" becomes "gemini-1.5-pro" """
+    return model[len("models/"):] if model.startswith("models/") else model
+
+
+class UsageLedger:
+    """
+    Token usage per day, endpoint, calling method and model, in SQLite.
+
+    Each model call adds to one aggregate row, so the table stays small and
+    every worker sharing the database file contributes to the same totals.
+    Cache hits are recorded against the method they saved a call for, which
+    lets stats() estimate the tokens (and cost) caching avoided.
+
+    Recording only adds to in-memory totals; a background thread per process
+    writes them out every flush_interval seconds (and at exit), so requests
+    never wait on the database.
+    """
+
+    def __init__(self, db_path, prices=None, flush_interval=5.0):
+        self.db_path = db_path
+        self.prices = {normalize_model_name(model): price for model, price in DEFAULT_PRICES.items()}
+        self.prices.update({normalize_model_name(model): price for model, price in (prices or {}).items()})
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flusher_pid = None
+
+        # Totals inherited from the parent are the parent's to write
+        os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS model_usage (
+                    day TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    method TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    calls INTEGER NOT NULL DEFAULT 0,
+                    errors INTEGER NOT NULL DEFAULT 0,
+                    cache_hits INTEGER NOT NULL DEFAULT 0,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    total_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency_total REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (day, endpoint, method, model)
+                )
+            """)
+
+    @classmethod
+    def from_env(cls, environ):
+        """
+        Build a ledger from USAGE_DB_PATH, USAGE_FLUSH_SECONDS and
+        MODEL_PRICES ('{"model": [input, output], ...}')
+        """
+        prices = json.loads(environ.get("MODEL_PRICES", "{}"))
+        return cls(environ.get("USAGE_DB_PATH", "usage.db"), {model: tuple(p) for model, p in prices.items()},
+                   flush_interval=float(environ.get("USAGE_FLUSH_SECONDS", "5")))
+
+    def _after_fork_in_child(self):
+        self._local = threading.local()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._flusher_pid = None
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections must not be shared
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return Transaction(conn)
+
+    def _add(self, endpoint, method, model, **counts):
+        key = (time.strftime("%Y-%m-%d", time.gmtime()), endpoint, method, model)
+        with self._pending_lock:
+            totals = self._pending.get(key)
+            if totals is None:
+                totals = self._pending[key] = dict.fromkeys(COUNTERS, 0)
+            for name, value in counts.items():
+                totals[name] += value
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self):
+        with self._pending_lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        atexit.register(self.flush)
+        threading.Thread(target=self._flush_loop, name="usage-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """Write the totals recorded in this process since the last flush"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(
+                    "INSERT INTO model_usage (day, endpoint, method, model, calls, errors, cache_hits, "
+                    "prompt_tokens, output_tokens, total_tokens, latency_total) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (day, endpoint, method, model) DO UPDATE SET "
+                    "calls = calls + excluded.calls, errors = errors + excluded.errors, "
+                    "cache_hits = cache_hits + excluded.cache_hits, "
+                    "prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                    "output_tokens = output_tokens + excluded.output_tokens, "
+                    "total_tokens = total_tokens + excluded.total_tokens, "
+                    "latency_total = latency_total + excluded.latency_total",
+                    [key + tuple(totals[name] for name in COUNTERS) for key, totals in pending.items()]
+                )
+        except sqlite3.Error as e:
+            # Accounting must never fail the work it is accounting for; keep the totals for the next flush
+            logger.error(f"Error recording model usage: {e}")
+            with self._pending_lock:
+                for key, totals in pending.items():
+                    current = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                    for name in COUNTERS:
+                        current[name] += totals[name]
+
+    def record_call(self, endpoint, method, model, latency, usage=None, ok=True):
+        """
+        Record one model call
+
+        Args:
+            endpoint (str): The route (or background context) the call served
+            method (str): The analyzer method that made the call
+            model (str): The model name
+            latency (float): Wall-clock seconds spent in the call
+            usage: The response usage metadata, if any
+            ok (bool): Whether the call succeeded
+        """
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        total_tokens = getattr(usage, "total_token_count", 0) or prompt_tokens + output_tokens
+        self._add(endpoint, method, normalize_model_name(model), calls=1, errors=0 if ok else 1,
+                  prompt_tokens=prompt_tokens, output_tokens=output_tokens, total_tokens=total_tokens,
+                  latency_total=latency)
+
+    def record_cache_hit(self, endpoint, method):
+        """Record a result served from cache instead of a model call"""
+        self._add(endpoint, method, "cache", cache_hits=1)
+
+    def cost(self, model, prompt_tokens, output_tokens):
+        """Estimated USD cost of a token count on a model (0 if the price is unknown)"""
+        input_price, output_price = self.prices.get(normalize_model_name(model), (0.0, 0.0))
+        return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+    def stats(self, days=7):
+        """
+        Aggregate usage per day and per endpoint over the last few days
+
+        Returns:
+            dict: Daily totals, per-endpoint/method/model rows and estimated cache savings
+        """
+        since = time.strftime("%Y-%m-%d", time.gmtime(time.time() - (days - 1) * 86400))
+        # Other workers' latest totals show up after their next flush
+        self.flush()
+        with self._connect() as conn:
+            rows = [dict(row) for row in conn.execute(
+                "SELECT * FROM model_usage WHERE day >= ? ORDER BY day, endpoint, method, model", (since,)
+            )]
+
+        by_day = {}
+        by_endpoint = []
+        # Average cost of a real call per method, to price what cache hits avoided
+        per_method = {}
+        for row in rows:
+            if row["model"] == "cache":
+                continue
+            row["cost_usd"] = round(self.cost(row["model"], row["prompt_tokens"], row["output_tokens"]), 6)
+            row["avg_latency"] = round(row["latency_total"] / row["calls"], 4) if row["calls"] else 0.0
+            by_endpoint.append(row)
+
+            day = by_day.setdefault(row["day"], {"calls": 0, "cache_hits": 0, "prompt_tokens": 0,
+                                                 "output_tokens": 0, "total_tokens": 0, "cost_usd": 0.0})
+            for field in ("calls", "prompt_tokens", "output_tokens", "total_tokens"):
+                day[field] += row[field]
+            day["cost_usd"] = round(day["cost_usd"] + row["cost_usd"], 6)
+
+            method = per_method.setdefault(row["method"], {"calls": 0, "total_tokens": 0, "cost_usd": 0.0})
+            method["calls"] += row["calls"]
+            method["total_tokens"] += row["total_tokens"]
+            method["cost_usd"] += row["cost_usd"]
+
+        savings = {}
+        for row in rows:
+            if row["model"] != "cache":
+                continue
+            by_day.setdefault(row["day"], {"calls": 0, "cache_hits": 0, "prompt_tokens": 0,
+                                           "output_tokens": 0, "total_tokens": 0, "cost_usd": 0.0})
+            by_day[row["day"]]["cache_hits"] += row["cache_hits"]
+
+            saved = savings.setdefault(row["method"], {"cache_hits": 0, "tokens_saved": 0, "cost_saved_usd": 0.0})
+            saved["cache_hits"] += row["cache_hits"]
+            method = per_method.get(row["method"])
+            if method and method["calls"]:
+                saved["tokens_saved"] += round(row["cache_hits"] * method["total_tokens"] / method["calls"])
+                saved["cost_saved_usd"] = round(
+                    saved["cost_saved_usd"] + row["cache_hits"] * method["cost_usd"] / method["calls"], 6
+                )
+
+        return {
+            "days": days,
+            "by_day": by_day,
+            "by_endpoint": by_endpoint,
+            "cache_savings": savings
+        }